@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Measures the time to import blowout in a fresh interpreter, as a worker process in a scan would.
+
+Exits non-zero if the best of several imports is slower than the limit (seconds) given as the first argument.
+"""
+import subprocess
+import sys
+
+limit   = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+repeats = 5
+
+code = 'import time; t = time.perf_counter(); import blowout; print(time.perf_counter() - t)'
+
+times = []
+for i in range(repeats):
+    out = subprocess.check_output([sys.executable, '-c', code])
+    times.append(float(out))
+
+best = min(times)
+print('import blowout: best {:.3f} s, worst {:.3f} s over {} runs (limit {:.3f} s)'.format(best, max(times), repeats, limit))
+
+# ======================================
+# Heavy dependencies must stay deferred
+# ======================================
+code = 'import sys, blowout; print(" ".join(m for m in ("h5py", "skimage", "scisalt", "pdb", "ipdb", "pkg_resources") if m in sys.modules))'
+loaded = subprocess.check_output([sys.executable, '-c', code]).decode().split()
+if loaded:
+    print('Imported eagerly: {}'.format(', '.join(loaded)))
+
+sys.exit(0 if best < limit and not loaded else 1)
@@ -1,23 +1,40 @@
+import collections as _collections
+import hashlib as _hashlib
 import numpy as _np
+import os as _os
 import scipy.special as _spp
 import scipy.constants as _spc
-import pdb
+import tempfile as _tempfile
 
 __all__ = [
     'E_complex',
-    'E_gauss_circ'
+    'E_gauss_circ',
+    'FieldCache'
     ]
 
 
 # ======================================
 # Bassetti-Erskine formula
 # ======================================
-def E_complex(x, y, sx, sy, q):
+def E_complex(x, y, sx, sy, q, x0=0, y0=0, theta=0):
     """
     The fields at :math:`(x, y)` of an elliptical gaussian region of charge with standard deviations ``sx`` and ``sq``, and total charge ``q``.
 
+    The charge may be centered at :math:`(x_0, y_0)` with its ``sx`` axis rotated by ``theta`` from the :math:`x` axis.
+
     Returns ``E_x, E_y``.
     """
+    # ======================================
+    # Move into the frame of the ellipse
+    # ======================================
+    x = x - x0
+    y = y - y0
+    rotated = _np.any(theta != 0)
+    if rotated:
+        cos = _np.cos(theta)
+        sin = _np.sin(theta)
+        x, y = x*cos + y*sin, y*cos - x*sin
+
     r_2_sx2_sy2 = _np.sqrt(2*(sx**2 - sy**2))
     r = sy/sx
     a = _np.abs(x)/r_2_sx2_sy2
@@ -28,6 +45,13 @@ def E_complex(x, y, sx, sy, q):
     E_c = - 1j*q / (2*_spc.epsilon_0*_np.sqrt(_np.pi)*r_2_sx2_sy2) * (_spp.wofz(aib) - _np.exp(-aib**2 + aribr**2) * _spp.wofz(aribr))
     E_x = _np.real(E_c) * _np.sign(x)
     E_y = -_np.imag(E_c) * _np.sign(y)
+
+    # ======================================
+    # Rotate fields back
+    # ======================================
+    if rotated:
+        E_x, E_y = E_x*cos - E_y*sin, E_x*sin + E_y*cos
+
     return E_x, E_y
 
 
@@ -42,9 +66,137 @@ def E_y(x, y, sx, sy, q):
 # ======================================
 # Circular
 # ======================================
-def E_gauss_circ(x, y, sr):
-    r = _np.sqrt(x**2 + y**2)
-    E_mag = (1-_np.exp( - r**2 / (2*sr**2))) / (2*_np.pi*r)
-    E_x = E_mag * x / r  # noqa
-    E_y = E_mag * y / r  # noqa
-    return _np.sqrt(E_x**2 + E_y**2)
+def E_gauss_circ(x, y, sr, q, x0=0, y0=0):
+    """
+    The fields at :math:`(x, y)` of a round gaussian region of charge with standard deviation ``sr`` and total charge ``q``, centered at :math:`(x_0, y_0)`: :math:`E_r = \\frac{q}{2\\pi\\epsilon_0 r} \\left(1 - e^{-r^2/2\\sigma_r^2}\\right)`.
+
+    This is the round limit of :func:`E_complex`, which cannot take ``sx == sy``, at a fraction of its cost. The field vanishes on the axis.
+
+    Returns ``E_x, E_y``.
+    """
+    x = x - x0
+    y = y - y0
+    r2 = x**2 + y**2
+
+    # ======================================
+    # E_r / r, with its finite limit on axis
+    # ======================================
+    on_axis = r2 == 0
+    E_r_r = _np.where(on_axis, 1 / (2*sr**2), -_np.expm1(-r2 / (2*sr**2)) / _np.where(on_axis, 1, r2))
+    E_r_r = E_r_r * q / (2*_np.pi*_spc.epsilon_0)
+
+    return E_r_r * x, E_r_r * y
+
+
+# ======================================
+# Cached Bassetti-Erskine fields
+# ======================================
+class FieldCache(object):
+    """
+    Memoizes :func:`E_complex` on fixed grids.
+
+    Fields are linear in the charge, so unit-charge fields are stored under a key of ``sx``, ``sy``, the offset and rotation, and a fingerprint of the grid, then scaled by ``q`` on a hit. The least recently used entries are evicted once they exceed ``max_bytes``. With ``directory``, entries are also saved there as ``.npy`` files so separate processes in a scan can share them.
+    """
+    def __init__(self, max_bytes=256*2**20, directory=None):
+        self._max_bytes = max_bytes
+        self._directory = directory
+        self._entries   = _collections.OrderedDict()
+        self._nbytes    = 0
+        self.hits       = 0
+        self.misses     = 0
+
+        if directory is not None:
+            _os.makedirs(directory, exist_ok=True)
+
+    @property
+    def max_bytes(self):
+        """
+        Largest total size of fields kept in memory.
+        """
+        return self._max_bytes
+
+    @property
+    def nbytes(self):
+        """
+        Total size of fields kept in memory.
+        """
+        return self._nbytes
+
+    @property
+    def directory(self):
+        """
+        Directory entries are persisted in, or ``None``.
+        """
+        return self._directory
+
+    def clear(self):
+        """
+        Drops all entries held in memory.
+        """
+        self._entries.clear()
+        self._nbytes = 0
+
+    def E_complex(self, x, y, sx, sy, q, x0=0, y0=0, theta=0):
+        """
+        Returns ``E_x, E_y`` as :func:`E_complex` would, from the cache where possible.
+        """
+        key = _fingerprint(x, y, sx, sy, x0, y0, theta)
+
+        E = self._entries.get(key)
+        if E is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            E = self._load(key)
+            if E is None:
+                self.misses += 1
+                E = _np.array(E_complex(x, y, sx, sy, 1, x0=x0, y0=y0, theta=theta))
+                self._save(key, E)
+            else:
+                self.hits += 1
+            self._store(key, E)
+
+        return E[0] * q, E[1] * q
+
+    def _store(self, key, E):
+        if E.nbytes > self._max_bytes:
+            return
+
+        self._entries[key] = E
+        self._nbytes += E.nbytes
+        while self._nbytes > self._max_bytes:
+            old_key, old = self._entries.popitem(last=False)
+            self._nbytes -= old.nbytes
+
+    def _path(self, key):
+        return _os.path.join(self._directory, '{}.npy'.format(key))
+
+    def _load(self, key):
+        if self._directory is None:
+            return None
+        try:
+            return _np.load(self._path(key))
+        except (IOError, ValueError):
+            return None
+
+    def _save(self, key, E):
+        if self._directory is None:
+            return
+
+        # ======================================
+        # Write then rename, so other processes
+        # never read a partial file
+        # ======================================
+        fd, tmpname = _tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        with _os.fdopen(fd, 'wb') as f:
+            _np.save(f, E)
+        _os.replace(tmpname, self._path(key))
+
+
+def _fingerprint(*arrays):
+    digest = _hashlib.sha1()
+    for array in arrays:
+        array = _np.ascontiguousarray(array, dtype=float)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
@@ -7,11 +7,37 @@ __version__ = '0.1.0'
 #     ]
 # __all__.sort()
 
-from . import Efield
-from . import drive
-from . import electrons
-from . import formulas
-from . import ions
-from . import load
-from . import plasma
-from .simframework import SimFrame
+import importlib as _importlib
+
+# ======================================
+# Submodules are imported on first use
+# ======================================
+_submodules = (
+    'Efield',
+    'candidates',
+    'density',
+    'diagnostics',
+    'drive',
+    'electrons',
+    'formulas',
+    'ions',
+    'load',
+    'metrics',
+    'particles',
+    'plasma',
+    'reanalysis',
+    'simframework',
+    'trajectories'
+    )
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return _importlib.import_module('.{}'.format(name), __name__)
+    if name == 'SimFrame':
+        return _importlib.import_module('.simframework', __name__).SimFrame
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_submodules) + ['SimFrame'])
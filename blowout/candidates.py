@@ -0,0 +1,262 @@
+"""
+Flat columnar storage for the ellipse candidates found in every slice.
+"""
+import numpy as _np
+from .support import _append_scalars
+from .support import _read_dict
+from .support import _write_scalars
+
+__all__ = [
+    'Candidates'
+    ]
+
+
+class Candidates(object):
+    """
+    Ellipse candidates of every slice, held as one flat column per field.
+
+    The candidates of slice ``i`` are rows ``offsets[i]:offsets[i+1]`` of every column. Fields holding an array per candidate, such as the Hough ``hist``, are ragged: their arrays are concatenated as well, with a second level of offsets per row. ``candidates[i]`` returns the candidates of slice ``i`` as the structured array the estimator produced, and ``candidates[i0:i1]`` a :class:`Candidates` holding those slices.
+    """
+    def __init__(self, dtype, columns, offsets, ragged=None):
+        self._dtype   = _np.dtype(dtype)
+        self._columns = columns
+        self._offsets = _np.asarray(offsets, dtype=_np.int64)
+        self._ragged  = ragged if ragged is not None else {}
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Builds the columns from a sequence of per-slice structured arrays.
+        """
+        counts = [len(result) for result in results]
+        offsets = _np.concatenate(([0], _np.cumsum(counts))).astype(_np.int64)
+        rows = _np.concatenate(results)
+
+        columns = dict()
+        ragged  = dict()
+        for name in rows.dtype.names:
+            if rows.dtype[name] == _np.dtype(object):
+                ragged[name] = _ravel_ragged(rows[name])
+            else:
+                columns[name] = _np.ascontiguousarray(rows[name])
+
+        return cls(rows.dtype, columns, offsets, ragged)
+
+    @classmethod
+    def from_flat(cls, results_flat):
+        """
+        Builds the columns from a structured array with one entry per slice, as stored by earlier versions.
+        """
+        names = results_flat.dtype.names
+        dtype = [(name, _field_dtype(results_flat[name])) for name in names]
+
+        results = list()
+        for entry in results_flat:
+            result = _np.zeros(_np.size(entry[names[0]]), dtype=dtype)
+            for name in names:
+                result[name] = entry[name]
+            results.append(result)
+
+        return cls.from_results(results)
+
+    @property
+    def dtype(self):
+        """
+        The structured dtype of the per-slice results.
+        """
+        return self._dtype
+
+    @property
+    def names(self):
+        """
+        Names of all fields.
+        """
+        return self._dtype.names
+
+    @property
+    def offsets(self):
+        """
+        Row offsets of every slice, of length ``len(self) + 1``.
+        """
+        return self._offsets
+
+    @property
+    def counts(self):
+        """
+        Number of candidates in every slice.
+        """
+        return _np.diff(self._offsets)
+
+    def __len__(self):
+        return self._offsets.size - 1
+
+    def column(self, name):
+        """
+        All rows of field ``name``; ragged fields are returned as an object array of views.
+        """
+        if name in self._ragged:
+            values, offsets = self._ragged[name]
+            return _unravel_ragged(values, offsets)
+        return self._columns[name]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise IndexError('Candidates only support contiguous slices.')
+            return self._take(start, max(start, stop))
+
+        # ======================================
+        # One slice as a structured array
+        # ======================================
+        i = range(len(self))[key]
+        r0, r1 = self._offsets[i], self._offsets[i+1]
+        result = _np.zeros(r1-r0, dtype=self._dtype)
+        for name, column in self._columns.items():
+            result[name] = column[r0:r1]
+        for name, (values, offsets) in self._ragged.items():
+            result[name] = _unravel_ragged(values, offsets[r0:r1+1])
+        return result
+
+    def _take(self, start, stop):
+        r0, r1 = self._offsets[start], self._offsets[stop]
+        columns = {name: column[r0:r1] for name, column in self._columns.items()}
+        ragged = dict()
+        for name, (values, offsets) in self._ragged.items():
+            ragged[name] = (values[offsets[r0]:offsets[r1]], offsets[r0:r1+1] - offsets[r0])
+        return Candidates(self._dtype, columns, self._offsets[start:stop+1] - r0, ragged)
+
+    def concat(self, other):
+        """
+        Returns a new :class:`Candidates` with the slices of ``other`` after those of this one.
+        """
+        columns = {name: _np.concatenate((column, other._columns[name])) for name, column in self._columns.items()}
+        ragged = dict()
+        for name, (values, offsets) in self._ragged.items():
+            ovalues, ooffsets = other._ragged[name]
+            ragged[name] = (_np.concatenate((values, ovalues)), _np.concatenate((offsets, ooffsets[1:] + offsets[-1])))
+        offsets = _np.concatenate((self._offsets, other._offsets[1:] + self._offsets[-1]))
+        return Candidates(self._dtype, columns, offsets, ragged)
+
+    def best(self, score='count_density'):
+        """
+        Row of the highest ``score`` in every slice, or -1 for slices without candidates.
+        """
+        counts = self.counts
+        segment = _np.repeat(_np.arange(len(self)), counts)
+
+        # ======================================
+        # Sort by slice, then by falling score:
+        # the first row of each slice is the best
+        # ======================================
+        order = _np.lexsort((-self._columns[score], segment))
+        best = _np.full(len(self), -1, dtype=_np.int64)
+        filled = counts > 0
+        best[filled] = order[self._offsets[:-1][filled]]
+        return best
+
+    def write(self, group):
+        """
+        Writes every column to ``group`` as one dataset, plus the offsets.
+        """
+        group.attrs['layout'] = 'columnar'
+        group.attrs['fields'] = _np.array(self.names, dtype='S')
+        _write_scalars(group, '_offsets', self._offsets)
+        for name, column in self._columns.items():
+            _write_scalars(group, name, column)
+        for name, (values, offsets) in self._ragged.items():
+            _write_scalars(group, name, values)
+            _write_scalars(group, '_{}_offsets'.format(name), offsets)
+
+    def append(self, group):
+        """
+        Grows columns written by :meth:`write` to hold every slice of this table, writing only the slices they do not already have.
+        """
+        start = group['_offsets'].shape[0] - 1
+        if start > len(self):
+            raise ValueError('Group already holds {} slices, table only has {}'.format(start, len(self)))
+
+        new = self._take(start, len(self))
+        r0 = self._offsets[start]
+        _append_scalars(group, '_offsets', new._offsets[1:] + r0)
+        for name, column in new._columns.items():
+            _append_scalars(group, name, column)
+        for name, (values, offsets) in new._ragged.items():
+            v0 = self._ragged[name][1][r0]
+            _append_scalars(group, name, values)
+            _append_scalars(group, '_{}_offsets'.format(name), offsets[1:] + v0)
+
+    @staticmethod
+    def num_stored(group):
+        """
+        Number of slices stored in ``group``.
+        """
+        if group.attrs.get('layout') == 'columnar':
+            return group['_offsets'].shape[0] - 1
+        names = [name for name in group.keys() if not name.startswith('_')]
+        return group[names[0]].shape[0]
+
+    @classmethod
+    def read(cls, group, start=0, stop=None, names=None):
+        """
+        Reads slices ``start`` to ``stop`` from ``group``, touching only the rows of those slices and, if ``names`` is given, only those fields.
+
+        Groups written by earlier versions, with one entry per slice, are read whole and converted.
+        """
+        if group.attrs.get('layout') != 'columnar':
+            return cls.from_flat(_read_dict(group.parent, group.name.split('/')[-1]))[start:stop]
+
+        if stop is None:
+            stop = group['_offsets'].shape[0] - 1
+        offsets = group['_offsets'][start:stop+1]
+        r0, r1 = offsets[0], offsets[-1]
+
+        if names is None:
+            names = [name.decode() for name in group.attrs['fields']]
+        dtype = list()
+        columns = dict()
+        ragged = dict()
+        for name in names:
+            roffsets_name = '_{}_offsets'.format(name)
+            if roffsets_name in group:
+                roffsets = group[roffsets_name][r0:r1+1]
+                ragged[name] = (group[name][roffsets[0]:roffsets[-1]], roffsets - roffsets[0])
+                dtype.append((name, object))
+            else:
+                columns[name] = group[name][r0:r1]
+                dtype.append((name, group[name].dtype))
+
+        return cls(dtype, columns, offsets - r0, ragged)
+
+
+def _field_dtype(entries):
+    # ======================================
+    # Per-slice entries of a legacy column:
+    # ragged if any holds arrays per row
+    # ======================================
+    if entries.dtype != _np.dtype(object):
+        return entries.dtype
+
+    dtypes = [_np.asarray(entry).dtype for entry in entries if _np.size(entry) > 0]
+    if not dtypes:
+        return _np.double
+    if _np.dtype(object) in dtypes:
+        return object
+    return _np.result_type(*dtypes)
+
+
+def _ravel_ragged(arrays):
+    # ======================================
+    # Concatenated values, offsets per row
+    # ======================================
+    arrays = [_np.ravel(array) for array in arrays]
+    offsets = _np.concatenate(([0], _np.cumsum([array.size for array in arrays]))).astype(_np.int64)
+    values = _np.concatenate(arrays) if arrays else _np.empty(0)
+    return values, offsets
+
+
+def _unravel_ragged(values, offsets):
+    out = _np.empty(offsets.size - 1, dtype=object)
+    for j in range(out.size):
+        out[j] = values[offsets[j]:offsets[j+1]]
+    return out
@@ -0,0 +1,174 @@
+"""
+On-demand reconstruction of the plasma electron density :math:`n_e(x, y, \\xi)` and the transverse electric field it produces, from stored trajectories.
+
+The trajectories are streamed from disk a block of slices at a time and deposited with cloud-in-cell weighting onto one fixed grid for the whole run. The results are written to ``<filebase>.density.h5`` as chunked 3D datasets. Blocks already written are recorded, so an interrupted reconstruction resumes where it stopped.
+"""
+import logging as _logging
+import numpy as _np
+import scipy.constants as _spc
+from .load import loadPlasmaParams as _loadPlasmaParams
+from .particles import ParticleState as _ParticleState
+from .support import _LazyModule
+
+_h5 = _LazyModule('h5py')
+
+_logger = _logging.getLogger(__name__)
+
+__all__ = [
+    'deposit_cic',
+    'transverse_fields',
+    'reconstruct'
+    ]
+
+
+def deposit_cic(x, y, bins, extent, weights=None):
+    """
+    Deposits particles at :math:`(x, y)`, each array of shape ``(slices, num_parts)``, onto a ``bins`` grid spanning ``extent = [x_min, x_max, y_min, y_max]`` with cloud-in-cell weighting.
+
+    Returns the deposited weight per cell, shape ``(slices, nx, ny)``. All slices are deposited in one vectorized pass.
+    """
+    nx, ny = _np.broadcast_to(bins, 2)
+    slices = _np.shape(x)[0]
+    if weights is None:
+        weights = _np.ones(_np.shape(x)[-1])
+
+    # ======================================
+    # Fractional cell indices of particles
+    # ======================================
+    fx = (x - extent[0]) * (nx / (extent[1] - extent[0])) - 0.5
+    fy = (y - extent[2]) * (ny / (extent[3] - extent[2])) - 0.5
+    ix = _np.floor(fx).astype(int)
+    iy = _np.floor(fy).astype(int)
+    wx = fx - ix
+    wy = fy - iy
+
+    offset = (_np.arange(slices) * (nx * ny))[:, None]
+    density = _np.zeros(slices * nx * ny)
+
+    # ======================================
+    # Deposit on the four nearest cells
+    # ======================================
+    for dx, weight_x in ((0, 1-wx), (1, wx)):
+        for dy, weight_y in ((0, 1-wy), (1, wy)):
+            jx = ix + dx
+            jy = iy + dy
+            inside = (jx >= 0) & (jx < nx) & (jy >= 0) & (jy < ny)
+            index = offset + jx*ny + jy
+            density += _np.bincount(
+                index[inside],
+                weights = (weight_x * weight_y * weights)[inside],
+                minlength = density.size
+                )
+
+    return density.reshape(slices, nx, ny)
+
+
+def transverse_fields(rho, extent):
+    """
+    Transverse electric field :math:`(E_x, E_y)` of the charge density ``rho`` (C/m\\ :sup:`3`), shape ``(slices, nx, ny)``, on the grid spanning ``extent``.
+
+    Every slice is convolved at once with the free-space field of a line charge, :math:`\\vec{r}/(2\\pi\\epsilon_0 r^2)`, by FFT on a grid padded to twice the size so no periodic images appear.
+    """
+    slices, nx, ny = _np.shape(rho)
+    dx = (extent[1] - extent[0]) / nx
+    dy = (extent[3] - extent[2]) / ny
+
+    # ======================================
+    # Line charge kernel on the padded grid,
+    # with negative offsets wrapped around
+    # ======================================
+    X = dx * _np.fft.fftfreq(2*nx, d=1/(2*nx))[:, None]
+    Y = dy * _np.fft.fftfreq(2*ny, d=1/(2*ny))[None, :]
+    r2 = X**2 + Y**2
+    r2[0, 0] = 1
+    K_x = X / r2 * (dx * dy / (2*_np.pi*_spc.epsilon_0))
+    K_y = Y / r2 * (dx * dy / (2*_np.pi*_spc.epsilon_0))
+
+    rho_k = _np.fft.rfft2(rho, s=(2*nx, 2*ny))
+    E_x = _np.fft.irfft2(rho_k * _np.fft.rfft2(K_x), s=(2*nx, 2*ny))[:, :nx, :ny]
+    E_y = _np.fft.irfft2(rho_k * _np.fft.rfft2(K_y), s=(2*nx, 2*ny))[:, :nx, :ny]
+
+    return E_x, E_y
+
+
+def reconstruct(filebase, bins=200, extent=None, chunk=64, fields=True):
+    """
+    Reconstructs :math:`n_e(x, y, \\xi)` for the run stored at ``filebase``, and with ``fields`` the transverse electric field of the plasma charge.
+
+    The grid spans ``extent = [x_min, x_max, y_min, y_max]``, by default the initial extent of the particles. Densities are normalized so the initial loading has the plasma density :math:`n_p` over the area it represents, :attr:`blowout.electrons.PlasmaE.area`, and the ions are taken to be the initial electron distribution. ``chunk`` slices are held in memory at a time.
+
+    A reconstruction is only resumed with the grid and ``fields`` it was started with.
+
+    Returns the name of the file written.
+    """
+    params   = _loadPlasmaParams(filename='{}.plasmaparams.h5'.format(filebase), gui=False)
+    filename = '{}.density.h5'.format(filebase)
+
+    with _h5.File('{}.electrons.h5'.format(filebase), 'r') as fe, _h5.File(filename, 'a') as fd:
+        coords = fe['data']['coords']
+        steps, _, num_parts = coords.shape
+        if 'weights' in fe['data']:
+            weights = fe['data']['weights'][()]
+        else:
+            weights = _np.ones(num_parts)
+
+        # ======================================
+        # Fix the grid from the initial slice
+        # ======================================
+        x0, y0, bx0, by0 = coords[0]
+        if extent is None:
+            extent = [_np.min(x0), _np.max(x0), _np.min(y0), _np.max(y0)]
+        nx, ny = _np.broadcast_to(bins, 2)
+        shape = (steps, nx, ny)
+
+        cell = (extent[1] - extent[0]) / nx * (extent[3] - extent[2]) / ny
+        area = fe['metadata'].attrs.get('area', None)
+        if area is None:
+            area = (_np.max(x0) - _np.min(x0)) * (_np.max(y0) - _np.min(y0))
+            _logger.warning('No loaded area stored in {}, taking the bounding box of the initial slice'.format(fe.filename))
+        scale = params.np * area / (_np.sum(weights) * cell)
+        n_ion = scale * deposit_cic(x0[None, :], y0[None, :], (nx, ny), extent, weights=weights)
+
+        # ======================================
+        # Create or reopen output datasets
+        # ======================================
+        names = ['density'] + (['E_x', 'E_y'] if fields else [])
+        if 'done' in fd and (tuple(fd.attrs['bins']) != (nx, ny) or not _np.allclose(fd.attrs['extent'], extent)):
+            raise ValueError('{} holds a reconstruction on a different grid.'.format(filename))
+        if 'done' in fd and bool(fd.attrs.get('fields', 'E_x' in fd)) != fields:
+            raise ValueError('{} holds a reconstruction with fields={}.'.format(filename, not fields))
+
+        for name in names:
+            if name not in fd:
+                fd.create_dataset(name, shape=shape, dtype=float, chunks=(1, nx, ny), compression='gzip')
+        if 'done' not in fd:
+            fd.create_dataset('done', shape=(steps, ), dtype=bool)
+            fd.attrs['bins']   = (nx, ny)
+            fd.attrs['extent'] = extent
+            fd.attrs['np']     = params.np
+            fd.attrs['fields'] = fields
+
+        done = fd['done'][()]
+
+        # ======================================
+        # Deposit one block of slices at a time,
+        # reading only blocks not yet written
+        # ======================================
+        for i0 in range(0, steps, chunk):
+            i1 = min(i0 + chunk, steps)
+            if _np.all(done[i0:i1]):
+                continue
+            state = _ParticleState(buffer=coords[i0:i1])
+
+            n_e = scale * deposit_cic(state.x, state.y, (nx, ny), extent, weights=weights)
+            fd['density'][i0:i1] = n_e
+
+            if fields:
+                E_x, E_y = transverse_fields(_spc.elementary_charge * (n_ion - n_e), extent)
+                fd['E_x'][i0:i1] = E_x
+                fd['E_y'][i0:i1] = E_y
+
+            fd['done'][i0:i1] = True
+            fd.flush()
+
+    return filename
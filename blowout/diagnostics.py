@@ -0,0 +1,263 @@
+"""
+Per-slice reductions of the plasma electrons, computed while :class:`blowout.simframework.SimFrame` pushes the particles.
+
+Every diagnostic reduces the live particles of one slice to a few numbers, held in small arrays with one row per slice. Pass them to the simulation as ``SimFrame(..., diagnostics=Diagnostics(Moments(), RadialProfile(...)))``; they are written to ``<filebase>.diagnostics.h5`` with the run and read back with :func:`blowout.load.loadDiagnostics`. Scans that only need these reductions can then skip the electron file with ``SimFrame.write(..., trajectories=False)``.
+
+New diagnostics subclass :class:`Diagnostic`, list their outputs and per-slice shapes in :attr:`Diagnostic.fields` and implement :meth:`Diagnostic.reduce`.
+"""
+import numpy as _np
+from . import __version__ as _version
+from .support import Timestamp as _Timestamp
+from .support import _LazyModule
+from .support import _timestamp2filename
+
+_h5 = _LazyModule('h5py')
+
+__all__ = [
+    'Diagnostic',
+    'Diagnostics',
+    'Moments',
+    'Quantiles',
+    'RadialProfile'
+    ]
+
+
+class Diagnostic(object):
+    """
+    Base class for per-slice reductions.
+
+    Subclasses set :attr:`name`, return ``{field: shape}`` for the per-slice outputs from :attr:`fields`, and return ``{field: value}`` for one slice from :meth:`reduce`.
+    """
+    name = None
+
+    def __init__(self):
+        self._data = {field: _np.full((0,) + shape, _np.nan) for field, shape in self.fields.items()}
+
+    @property
+    def fields(self):
+        """
+        Per-slice shape of every output.
+        """
+        raise NotImplementedError
+
+    @property
+    def data(self):
+        """
+        Output arrays, one row per slice.
+        """
+        return self._data
+
+    @property
+    def attrs(self):
+        """
+        Parameters of the diagnostic, stored as attributes.
+        """
+        return {}
+
+    def reduce(self, x, y, bx, by, weights):
+        """
+        Reduces the live particles of one slice.
+        """
+        raise NotImplementedError
+
+    def update(self, i, x, y, bx, by, weights):
+        """
+        Stores the reduction of slice ``i``.
+        """
+        for field, value in self.reduce(x, y, bx, by, weights).items():
+            self._data[field][i] = value
+
+    def _resize(self, steps):
+        # ======================================
+        # Keep slices in common, NaN elsewhere
+        # ======================================
+        for field, array in self._data.items():
+            resized = _np.full((steps,) + array.shape[1:], _np.nan)
+            common = min(steps, array.shape[0])
+            resized[:common] = array[:common]
+            self._data[field] = resized
+
+
+class Moments(Diagnostic):
+    """
+    Weighted first and second moments of the electrons in every slice: centroids :math:`\\langle x \\rangle`, :math:`\\langle y \\rangle`, RMS sizes :math:`\\sigma_x`, :math:`\\sigma_y`, RMS transverse velocities :math:`\\sigma_{\\beta_x}`, :math:`\\sigma_{\\beta_y}` and the trace-space emittances :math:`\\epsilon_x = \\sqrt{\\langle x^2 \\rangle \\langle \\beta_x^2 \\rangle - \\langle x \\beta_x \\rangle^2}`, :math:`\\epsilon_y`, all about the centroids.
+    """
+    name = 'moments'
+
+    @property
+    def fields(self):
+        return {field: () for field in ('x_mean', 'y_mean', 'sx', 'sy', 'sbx', 'sby', 'emit_x', 'emit_y', 'charge')}
+
+    def reduce(self, x, y, bx, by, weights):
+        finite = _np.isfinite(x) & _np.isfinite(y) & _np.isfinite(bx) & _np.isfinite(by)
+        x, y, bx, by, weights = x[finite], y[finite], bx[finite], by[finite], weights[finite]
+        total = _np.sum(weights)
+        if total == 0:
+            return {}
+
+        # ======================================
+        # One weighted pass per coordinate
+        # ======================================
+        means = [_np.dot(weights, u) / total for u in (x, y, bx, by)]
+        dx, dy, dbx, dby = [u - mean for u, mean in zip((x, y, bx, by), means)]
+        xx, yy, bxbx, byby, xbx, yby = [_np.dot(weights, u*v) / total for u, v in ((dx, dx), (dy, dy), (dbx, dbx), (dby, dby), (dx, dbx), (dy, dby))]
+
+        return {
+            'x_mean' : means[0],
+            'y_mean' : means[1],
+            'sx'     : _np.sqrt(xx),
+            'sy'     : _np.sqrt(yy),
+            'sbx'    : _np.sqrt(bxbx),
+            'sby'    : _np.sqrt(byby),
+            'emit_x' : _np.sqrt(max(xx*bxbx - xbx**2, 0)),
+            'emit_y' : _np.sqrt(max(yy*byby - yby**2, 0)),
+            'charge' : total
+            }
+
+
+class RadialProfile(Diagnostic):
+    """
+    Weighted histogram of the electron radius :math:`r = \\sqrt{x^2 + y^2}` in every slice, with ``bins`` equal bins from 0 to ``r_max``.
+
+    The counts are divided by the annulus area, so a uniform plasma gives a flat profile.
+    """
+    name = 'radial_profile'
+
+    def __init__(self, bins, r_max):
+        self._bins  = bins
+        self._r_max = r_max
+        self._edges = _np.linspace(0, r_max, bins+1)
+        self._area  = _np.pi * _np.diff(self._edges**2)
+        super().__init__()
+
+    @property
+    def bins(self):
+        """
+        Number of radial bins.
+        """
+        return self._bins
+
+    @property
+    def r_max(self):
+        """
+        Outer edge of the last bin.
+        """
+        return self._r_max
+
+    @property
+    def edges(self):
+        """
+        Bin edges in :math:`r`.
+        """
+        return self._edges
+
+    @property
+    def fields(self):
+        return {'density': (self._bins,)}
+
+    @property
+    def attrs(self):
+        return {'bins': self._bins, 'r_max': self._r_max}
+
+    def reduce(self, x, y, bx, by, weights):
+        r = _np.hypot(x, y)
+        inside = r < self._r_max
+        ind = (r[inside] * (self._bins / self._r_max)).astype(_np.intp)
+        counts = _np.bincount(ind, weights=weights[inside], minlength=self._bins)
+        return {'density': counts / self._area}
+
+
+class Quantiles(Diagnostic):
+    """
+    Weighted quantiles ``q`` of the electron radius :math:`r = \\sqrt{x^2 + y^2}` in every slice, e.g. the radius enclosing half the charge.
+
+    Every particle stands at the midpoint of its share of the cumulative weight, and the quantiles are interpolated between them, so equal weights give :func:`numpy.quantile` with ``method='hazen'``.
+    """
+    name = 'quantiles'
+
+    def __init__(self, q=(0.1, 0.5, 0.9)):
+        self._q = _np.array(q, dtype=float)
+        super().__init__()
+
+    @property
+    def q(self):
+        """
+        Quantiles taken.
+        """
+        return self._q
+
+    @property
+    def fields(self):
+        return {'r': (self._q.size,)}
+
+    @property
+    def attrs(self):
+        return {'q': self._q}
+
+    def reduce(self, x, y, bx, by, weights):
+        r = _np.hypot(x, y)
+        finite = _np.isfinite(r)
+        r, weights = r[finite], weights[finite]
+        total = _np.sum(weights)
+        if total == 0:
+            return {}
+
+        # ======================================
+        # Interpolate the cumulative weight of
+        # the particles sorted by radius
+        # ======================================
+        order = _np.argsort(r)
+        r, weights = r[order], weights[order]
+        cdf = (_np.cumsum(weights) - weights/2) / total
+        return {'r': _np.interp(self._q, cdf, r)}
+
+
+class Diagnostics(_Timestamp):
+    """
+    The set of :class:`Diagnostic` run alongside a simulation.
+    """
+    def __init__(self, *diagnostics):
+        super().__init__()
+        names = [diagnostic.name for diagnostic in diagnostics]
+        if len(set(names)) != len(names):
+            raise ValueError('Diagnostic names must be unique, got: {}'.format(names))
+        self._diagnostics = diagnostics
+
+    def __iter__(self):
+        return iter(self._diagnostics)
+
+    def __len__(self):
+        return len(self._diagnostics)
+
+    def __getitem__(self, name):
+        for diagnostic in self._diagnostics:
+            if diagnostic.name == name:
+                return diagnostic
+        raise KeyError(name)
+
+    def update(self, i, x, y, bx, by, weights):
+        """
+        Reduces slice ``i`` with every diagnostic.
+        """
+        for diagnostic in self._diagnostics:
+            diagnostic.update(i, x, y, bx, by, weights)
+
+    def _resize(self, steps):
+        for diagnostic in self._diagnostics:
+            diagnostic._resize(steps)
+
+    def write(self, filename=None):
+        """
+        Writes every diagnostic to its own group.
+        """
+        filename = _timestamp2filename(self, ftype='diagnostics', filename=filename)
+        with _h5.File(filename, 'w') as f:
+            f.attrs['version'] = _version
+            gdata = f.create_group('data')
+            for diagnostic in self._diagnostics:
+                group = gdata.create_group(diagnostic.name)
+                group.attrs['class'] = type(diagnostic).__name__
+                for key, value in diagnostic.attrs.items():
+                    group.attrs[key] = value
+                for field, array in diagnostic.data.items():
+                    group.create_dataset(name=field, data=array, compression='gzip')
@@ -1,25 +1,47 @@
 from . import Efield as _Efield
-import h5py as _h5
-import pkg_resources as _pkg_resources
-import scisalt as _ss
+import numpy as _np
+from . import __version__ as _version
 from .support import _timestamp2filename
 from .support import Timestamp as _Timestamp
+from .support import _LazyModule
 
-_version = _pkg_resources.get_distribution('blowout').version
+_h5 = _LazyModule('h5py')
+_ss = _LazyModule('scisalt')
 
 
 class Drive(_Timestamp):
     """
     Contains properties derived from the drive bunch.
+
+    The longitudinal profile is Gaussian with standard deviation ``sz`` unless a tabulated line charge density ``profile`` (in C/m, e.g. a current divided by :math:`c`) is given on the points ``xi``. Either way it is evaluated once on the simulation grid by :meth:`set_grid`, after which lookups per slice are free.
+
+    The bunch may be centered at ``(x0, y0)`` and rotated by ``tilt`` about its axis. These are constants, or arrays tabulated on the points ``xi_centroid`` to describe a centroid and tilt that vary along the bunch; they are also evaluated once on the simulation grid.
+
+    A bunch with ``|sx - sy|`` at most ``round_tol`` times the larger of the two is treated as round, with :math:`\\sigma_r = \\sqrt{(\\sigma_x^2 + \\sigma_y^2)/2}`, and its fields come from :func:`blowout.Efield.E_gauss_circ` instead of :func:`blowout.Efield.E_complex`.
     """
-    def __init__(self, sx, sy, sz, charge, gamma):
+    def __init__(self, sx, sy, sz, charge, gamma, xi=None, profile=None, x0=0, y0=0, tilt=0, xi_centroid=None, round_tol=1e-6):
         super().__init__()
+        if (xi is None) != (profile is None):
+            raise ValueError('A tabulated profile needs both xi and profile.')
+        if xi_centroid is None and not all(_np.isscalar(value) for value in (x0, y0, tilt)):
+            raise ValueError('Tabulated x0, y0 or tilt need xi_centroid.')
+
         self._sx        = sx
         self._sy        = sy
         self._sz        = sz
         self._charge    = charge
         self._gamma     = gamma
-        self._timestamp = None
+        self._xi        = None if xi is None else _np.asarray(xi, dtype=float)
+        self._profile   = None if profile is None else _np.asarray(profile, dtype=float)
+        self._x0          = x0
+        self._y0          = y0
+        self._tilt        = tilt
+        self._xi_centroid = None if xi_centroid is None else _np.asarray(xi_centroid, dtype=float)
+        self._round_tol   = round_tol
+        self._xi_grid     = None
+        self._q           = None
+        self._centroid    = None
+        self._timestamp   = None
 
     @property
     def sx(self):
@@ -56,13 +78,136 @@ class Drive(_Timestamp):
         """
         return self._gamma
 
-    def E_fields(self, x, y, xi):
+    @property
+    def xi(self):
+        """
+        Points :math:`\\xi` of the tabulated profile, or ``None`` for a Gaussian bunch.
+        """
+        return self._xi
+
+    @property
+    def profile(self):
+        """
+        Tabulated line charge density in C/m, or ``None`` for a Gaussian bunch.
+        """
+        return self._profile
+
+    @property
+    def q(self):
+        """
+        Line charge density on the grid given to :meth:`set_grid`.
+        """
+        return self._q
+
+    @property
+    def x0(self):
+        """
+        Drive beam centroid in :math:`x`, constant or tabulated on :attr:`xi_centroid`.
+        """
+        return self._x0
+
+    @property
+    def y0(self):
+        """
+        Drive beam centroid in :math:`y`, constant or tabulated on :attr:`xi_centroid`.
+        """
+        return self._y0
+
+    @property
+    def tilt(self):
+        """
+        Rotation of the drive beam ``sx`` axis from the :math:`x` axis, constant or tabulated on :attr:`xi_centroid`.
+        """
+        return self._tilt
+
+    @property
+    def xi_centroid(self):
+        """
+        Points :math:`\\xi` where :attr:`x0`, :attr:`y0` and :attr:`tilt` are tabulated, or ``None`` if they are constant.
+        """
+        return self._xi_centroid
+
+    @property
+    def round_tol(self):
+        """
+        Relative difference of ``sx`` and ``sy`` up to which the bunch is treated as round.
+        """
+        return self._round_tol
+
+    @property
+    def is_round(self):
+        """
+        Whether the bunch is treated as round, per bunch for a :class:`MultiDrive`.
+        """
+        return _np.abs(self.sx - self.sy) <= self.round_tol * _np.maximum(self.sx, self.sy)
+
+    @property
+    def sr(self):
+        """
+        Drive beam round-equivalent standard deviation :math:`\\sigma_r = \\sqrt{(\\sigma_x^2 + \\sigma_y^2)/2}`.
+        """
+        return _np.sqrt((self.sx**2 + self.sy**2) / 2)
+
+    def centroid(self, xi):
+        """
+        Returns ``x0, y0, tilt`` at :math:`\\xi`. With :attr:`xi_centroid`, any of them given as a constant stays constant.
+        """
+        if self._xi_centroid is None:
+            return self.x0, self.y0, self.tilt
+        else:
+            return tuple(_np.interp(xi, self._xi_centroid, _np.broadcast_to(value, self._xi_centroid.shape)) for value in (self.x0, self.y0, self.tilt))
+
+    def q_profile(self, xi):
+        """
+        Line charge density in C/m at :math:`\\xi`.
+        """
+        if self._profile is None:
+            # This actually is q = rho(z) * dz / dz.
+            return self.charge * _ss.numpy.gaussian(xi, 0, self.sz)
+        else:
+            return _np.interp(xi, self._xi, self._profile, left=0, right=0)
+
+    def set_grid(self, xi_bubble):
+        """
+        Evaluates the longitudinal profile once on the simulation slices ``xi_bubble``.
+        """
+        if self._xi_grid is not None and _np.array_equal(self._xi_grid, xi_bubble):
+            return
+
+        self._xi_grid  = _np.array(xi_bubble)
+        self._q        = self.q_profile(self._xi_grid)
+        self._centroid = [_np.broadcast_to(value, _np.shape(self._q)) for value in self.centroid(self._xi_grid)]
+
+    def E_fields(self, x, y, xi, step=None):
         """
         Returns the fields at :math:`(x, y)`.
+
+        If ``step`` is given, the charge density, centroid and tilt are looked up on the grid set by :meth:`set_grid` rather than recomputed.
         """
-        # This actually is q = rho(z) * dz / dz.
-        q = self.charge * _ss.numpy.gaussian(xi, 0, self.sz)
-        return _Efield.E_complex(x, y, self.sx, self.sy, q)
+        q, x0, y0, tilt = self._slice(xi, step)
+        if self.is_round:
+            return _Efield.E_gauss_circ(x, y, self.sr, q, x0=x0, y0=y0)
+        return _Efield.E_complex(x, y, self.sx, self.sy, q, x0=x0, y0=y0, theta=tilt)
+
+    def _slice(self, xi, step):
+        if step is None:
+            return (self.q_profile(xi), ) + self.centroid(xi)
+        else:
+            x0, y0, tilt = self._centroid
+            return self._q[step], x0[step], y0[step], tilt[step]
+
+    def _write_metadata(self, gmeta):
+        gmeta.attrs.create(name='sx'     , data=self.sx     )
+        gmeta.attrs.create(name='sy'     , data=self.sy     )
+        gmeta.attrs.create(name='sz'     , data=self.sz     )
+        gmeta.attrs.create(name='charge' , data=self.charge )
+        gmeta.attrs.create(name='gamma'  , data=self.gamma  )
+        gmeta.attrs.create(name='x0'     , data=self.x0     )
+        gmeta.attrs.create(name='y0'     , data=self.y0     )
+        gmeta.attrs.create(name='tilt'   , data=self.tilt   )
+        gmeta.attrs.create(name='round_tol', data=self.round_tol)
+        if self.xi_centroid is not None:
+            gmeta.attrs.create(name='xi_centroid', data=self.xi_centroid)
 
     def write(self, filename=None):
         filename = _timestamp2filename(self, ftype='drive', filename=filename)
@@ -78,8 +223,133 @@ class Drive(_Timestamp):
             # Write metadata
             # ======================================
             gmeta = f.create_group('metadata')
-            gmeta.attrs.create(name='sx'     , data=self.sx     )
-            gmeta.attrs.create(name='sy'     , data=self.sy     )
-            gmeta.attrs.create(name='sz'     , data=self.sz     )
-            gmeta.attrs.create(name='charge' , data=self.charge )
-            gmeta.attrs.create(name='gamma'  , data=self.gamma  )
+            self._write_metadata(gmeta)
+
+            # ======================================
+            # Write tabulated profile
+            # ======================================
+            if self.profile is not None:
+                gdata = f.create_group('data')
+                gdata.create_dataset(name='xi'      , data=self.xi      )
+                gdata.create_dataset(name='profile' , data=self.profile )
+
+
+class MultiDrive(Drive):
+    """
+    A superposition of Gaussian bunches, such as a drive and witness or a bunch train.
+
+    ``sx``, ``sy``, ``sz``, ``charge`` and the longitudinal centers ``xi0`` take one entry per bunch. The fields of every bunch whose line charge at a slice exceeds ``rtol`` times the largest peak line charge are evaluated together in one broadcast call; the rest are skipped.
+
+    ``x0``, ``y0`` and ``tilt`` are shared by all bunches or take one entry per bunch, so e.g. a witness may sit off the drive axis. With ``xi_centroid`` they are tabulated with shape ``(len(xi_centroid), )`` to share or ``(len(xi_centroid), bunches)`` per bunch.
+    """
+    def __init__(self, sx, sy, sz, charge, gamma, xi0=0, rtol=1e-6, x0=0, y0=0, tilt=0, xi_centroid=None, round_tol=1e-6):
+        sx, sy, sz, charge, xi0 = [_np.array(value, dtype=float) for value in _np.broadcast_arrays(
+            _np.atleast_1d(sx), _np.atleast_1d(sy), _np.atleast_1d(sz), _np.atleast_1d(charge), _np.atleast_1d(xi0)
+            )]
+        super().__init__(sx=sx, sy=sy, sz=sz, charge=charge, gamma=gamma, xi_centroid=xi_centroid, round_tol=round_tol)
+        self._xi0  = xi0
+        self._rtol = rtol
+
+        # ======================================
+        # Centroid and tilt per bunch, along the
+        # last axis
+        # ======================================
+        if xi_centroid is None:
+            shape = sx.shape
+        else:
+            shape = (self.xi_centroid.size, ) + sx.shape
+        x0, y0, tilt = [_np.asarray(value, dtype=float) for value in (x0, y0, tilt)]
+        if xi_centroid is not None:
+            x0, y0, tilt = [value[:, None] if value.ndim == 1 else value for value in (x0, y0, tilt)]
+        self._x0, self._y0, self._tilt = [_np.array(_np.broadcast_to(value, shape)) for value in (x0, y0, tilt)]
+
+    @property
+    def xi0(self):
+        """
+        Longitudinal centers :math:`\\xi_0` of the bunches.
+        """
+        return self._xi0
+
+    @property
+    def rtol(self):
+        """
+        Bunches with line charge below ``rtol`` times the largest peak line charge are skipped.
+        """
+        return self._rtol
+
+    def q_profile(self, xi):
+        """
+        Line charge density in C/m of each bunch at :math:`\\xi`, with the bunches along the last axis.
+        """
+        return self.charge * _ss.numpy.gaussian(_np.expand_dims(xi, -1), self.xi0, self.sz)
+
+    def centroid(self, xi):
+        """
+        Returns ``x0, y0, tilt`` of each bunch at :math:`\\xi`, with the bunches along the last axis.
+        """
+        if self._xi_centroid is None:
+            return self.x0, self.y0, self.tilt
+        else:
+            return tuple(
+                _np.stack([_np.interp(xi, self._xi_centroid, column) for column in value.T], axis=-1)
+                for value in (self.x0, self.y0, self.tilt)
+                )
+
+    def E_fields(self, x, y, xi, step=None):
+        """
+        Returns the summed fields of all bunches at :math:`(x, y)`, each about its own centroid and tilt.
+
+        If ``step`` is given, the charge densities, centroids and tilts are looked up on the grid set by :meth:`set_grid` rather than recomputed.
+        """
+        q, x0, y0, tilt = self._slice(xi, step)
+
+        # ======================================
+        # Skip bunches with negligible charge
+        # ======================================
+        q_peak = _np.max(_np.abs(self.charge) / (_np.sqrt(2*_np.pi) * self.sz))
+        active = _np.abs(q) > self.rtol * q_peak
+        if not _np.any(active):
+            return _np.zeros(_np.shape(x)), _np.zeros(_np.shape(y))
+
+        # ======================================
+        # Bunches broadcast along a new first
+        # axis, round ones without wofz
+        # ======================================
+        shape = (-1, ) + (1, ) * _np.ndim(x)
+        E_x = _np.zeros(_np.shape(x))
+        E_y = _np.zeros(_np.shape(y))
+
+        round_ = active & self.is_round
+        if _np.any(round_):
+            E_round = _Efield.E_gauss_circ(
+                x,
+                y,
+                self.sr[round_].reshape(shape),
+                q[round_].reshape(shape),
+                x0 = x0[round_].reshape(shape),
+                y0 = y0[round_].reshape(shape)
+                )
+            E_x = E_x + _np.sum(E_round[0], axis=0)
+            E_y = E_y + _np.sum(E_round[1], axis=0)
+
+        elliptic = active & ~self.is_round
+        if _np.any(elliptic):
+            E_elliptic = _Efield.E_complex(
+                x,
+                y,
+                self.sx[elliptic].reshape(shape),
+                self.sy[elliptic].reshape(shape),
+                q[elliptic].reshape(shape),
+                x0    = x0[elliptic].reshape(shape),
+                y0    = y0[elliptic].reshape(shape),
+                theta = tilt[elliptic].reshape(shape)
+                )
+            E_x = E_x + _np.sum(E_elliptic[0], axis=0)
+            E_y = E_y + _np.sum(E_elliptic[1], axis=0)
+
+        return E_x, E_y
+
+    def _write_metadata(self, gmeta):
+        super()._write_metadata(gmeta)
+        gmeta.attrs.create(name='xi0'  , data=self.xi0  )
+        gmeta.attrs.create(name='rtol' , data=self.rtol )
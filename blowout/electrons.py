@@ -1,18 +1,26 @@
 from .support import _timestamp2filename
-import h5py as _h5
 import numpy as _np
-import pkg_resources as _pkg_resources
-import scisalt as _ss
+import scipy.special as _spp
+import warnings as _warnings
+from . import __version__ as _version
+from .particles import ParticleState as _ParticleState
 from .support import Timestamp as _Timestamp
+from .support import _LazyModule
 
-_version = _pkg_resources.get_distribution('blowout').version
+_h5   = _LazyModule('h5py')
+_spst = _LazyModule('scipy.stats')
+_qmc  = _LazyModule('scipy.stats.qmc')
+
+_methods = ('random', 'sobol', 'halton')
 
 
 class PlasmaE(_Timestamp):
     """
     Base class for all generated plasmas.
+
+    The coordinates are held in ``buffer`` if given, e.g. one from :meth:`blowout.particles.ParticleState.memmap`, which keeps backing them when the run is extended or truncated (see :meth:`blowout.particles.ParticleState.resize`).
     """
-    def __init__(self, PlasmaParams, num_parts):
+    def __init__(self, PlasmaParams, num_parts, buffer=None):
         super().__init__()
         self._PlasmaParams = PlasmaParams
         self._num_parts = num_parts
@@ -22,10 +30,14 @@ class PlasmaE(_Timestamp):
         # Set up particle coordinates
         # ======================================
         steps = self.PlasmaParams.xi_bubble.size
-        self.x_coords  = _np.empty(shape=(steps, num_parts))
-        self.y_coords  = _np.empty(shape=(steps, num_parts))
-        self.bx_coords = _np.empty(shape=(steps, num_parts))
-        self.by_coords = _np.empty(shape=(steps, num_parts))
+        if buffer is None:
+            self._coords = _ParticleState(steps=steps, num_parts=num_parts)
+        elif buffer.shape != (steps, len(_ParticleState.fields), num_parts):
+            raise ValueError('Buffer must have shape {}, got: {}'.format((steps, len(_ParticleState.fields), num_parts), buffer.shape))
+        else:
+            self._coords = _ParticleState(buffer=buffer)
+        self._weights = _np.ones(num_parts)
+        self._area    = None
 
     @property
     def PlasmaParams(self):
@@ -41,16 +53,98 @@ class PlasmaE(_Timestamp):
         """
         return self._num_parts
 
+    @property
+    def weights(self):
+        """
+        Number of physical particles each particle represents, relative to a uniform loading.
+        """
+        return self._weights
+
+    @weights.setter
+    def weights(self, value):
+        self._weights[...] = value
+
+    @property
+    def area(self):
+        """
+        Transverse area the initial loading represents at the plasma density, or ``None`` if unknown.
+        """
+        return self._area
+
+    @property
+    def coords(self):
+        """
+        The :class:`blowout.particles.ParticleState` holding all particle coordinates.
+        """
+        return self._coords
+
+    @property
+    def x_coords(self):
+        """
+        Particle :math:`x` for all slices, shape ``(steps, num_parts)``.
+        """
+        return self._coords.x
+
+    @x_coords.setter
+    def x_coords(self, value):
+        self._coords.x[...] = value
+
+    @property
+    def y_coords(self):
+        """
+        Particle :math:`y` for all slices, shape ``(steps, num_parts)``.
+        """
+        return self._coords.y
+
+    @y_coords.setter
+    def y_coords(self, value):
+        self._coords.y[...] = value
+
+    @property
+    def bx_coords(self):
+        """
+        Particle :math:`\\beta_x` for all slices, shape ``(steps, num_parts)``.
+        """
+        return self._coords.bx
+
+    @bx_coords.setter
+    def bx_coords(self, value):
+        self._coords.bx[...] = value
+
+    @property
+    def by_coords(self):
+        """
+        Particle :math:`\\beta_y` for all slices, shape ``(steps, num_parts)``.
+        """
+        return self._coords.by
+
+    @by_coords.setter
+    def by_coords(self, value):
+        self._coords.by[...] = value
+
     def _set_timestamp(self, timestamp):
         self._timestamp = timestamp
         self._PlasmaParams._set_timestamp(timestamp)
 
 
-    def write(self, filename=None):
+    def _resize(self):
+        # ======================================
+        # Fit storage to the current xi_bubble
+        # ======================================
+        self._coords = self._coords.resize(self.PlasmaParams.xi_bubble.size)
+
+    def write(self, filename=None, append=False, executor=None):
         """
         Write all of the particles and plasma parameters to a file.
+
+        With ``append``, the file must already hold the earlier slices of this run; only the new slices are written to it. With an ``executor``, the coordinates are compressed in parallel on it.
         """
         filename = _timestamp2filename(self, ftype='electrons', filename=filename)
+        if append:
+            with _h5.File(filename, 'a') as f:
+                self.coords.append(f['data']['coords'], executor=executor)
+            return
+
         # ======================================
         # Create new filename
         # ======================================
@@ -59,19 +153,18 @@ class PlasmaE(_Timestamp):
             f.attrs['version'] = _version
             # f.attrs.create(name='version', data=_version)
             
-            shape = self.x_coords.shape
             gdata = f.create_group('data')
 
             # ======================================
             # Write data
             # ======================================
-            dx  = gdata.create_dataset(name='x_coords'  , data=self.x_coords  , shape=shape , compression="gzip")  # noqa
-            dy  = gdata.create_dataset(name='y_coords'  , data=self.y_coords  , shape=shape , compression="gzip")  # noqa
-            dbx = gdata.create_dataset(name='bx_coords' , data=self.bx_coords , shape=shape , compression="gzip")  # noqa
-            dby = gdata.create_dataset(name='by_coords' , data=self.by_coords , shape=shape , compression="gzip")  # noqa
+            dcoords  = self.coords.write(gdata, name='coords', executor=executor)  # noqa
+            dweights = gdata.create_dataset(name='weights', data=self.weights, compression="gzip")  # noqa
 
             gmeta = f.create_group('metadata')
             gmeta.attrs.create(name='num_parts' , data=self.num_parts )
+            if self.area is not None:
+                gmeta.attrs.create(name='area'  , data=self.area      )
 
 
 class PlasmaE_Grid(PlasmaE):
@@ -81,12 +174,17 @@ class PlasmaE_Grid(PlasmaE):
     def __init__(self, num_pts, x_mag, y_mag, PlasmaParams):
         super().__init__(
             PlasmaParams = PlasmaParams,
-            num_parts    = num_parts
+            num_parts    = num_pts**2
             )
         self._num_pts = num_pts
         self._x_mag   = x_mag
         self._y_mag   = y_mag
 
+        # ======================================
+        # Every point stands for one grid cell
+        # ======================================
+        self._area    = (2*x_mag) * (2*y_mag) * (num_pts / (num_pts-1))**2
+
         # ======================================
         # Set up transverse grid
         # ======================================
@@ -124,23 +222,33 @@ class PlasmaE_Grid(PlasmaE):
 class PlasmaE_Random(PlasmaE):
     """
     Plasma electrons coordinates for `num_parts` particles, initialized randomly within a box with :math:`-x_{mag} < x < x_{mag}` and :math:`-y_{mag} < y < y_{mag}`.
+
+    ``method`` is one of ``'random'``, ``'sobol'`` or ``'halton'``; the quasi-random sequences fill the box more evenly and so give less noise for the same number of particles. The loading is fixed by ``seed`` (an integer or :class:`numpy.random.SeedSequence`), independent of ``chunk``, and is written ``chunk`` particles at a time straight into the coordinates, which may live in ``buffer``.
     """
-    def __init__(self, num_parts, x_mag, y_mag, PlasmaParams):
-        num_parts_quad = _np.int(num_parts/4)
+    def __init__(self, num_parts, x_mag, y_mag, PlasmaParams, seed=None, method='random', chunk=2**20, buffer=None):
+        num_parts_quad = int(num_parts/4)
         super().__init__(
             PlasmaParams = PlasmaParams,
-            num_parts    = num_parts_quad * 4
+            num_parts    = num_parts_quad * 4,
+            buffer       = buffer
             )
         self._x_mag   = x_mag
         self._y_mag   = y_mag
+        self._seed    = _np.random.SeedSequence(seed) if not isinstance(seed, _np.random.SeedSequence) else seed
+        self._method  = method
+        self._area    = (2*x_mag) * (2*y_mag)
 
         # ======================================
-        # Set initial conditions
+        # Set initial conditions, one quadrant
+        # mirrored into the other three
         # ======================================
-        x = _np.random.rand(num_parts_quad) * x_mag
-        y = _np.random.rand(num_parts_quad) * y_mag
-        self.x_coords[0, :] = _np.concatenate((x , -x , x  , -x))
-        self.y_coords[0, :] = _np.concatenate((y , y  , -y , -y))
+        for j0, u in uniform_chunks(num_parts_quad, seed=self._seed, method=method, chunk=chunk):
+            x = u[:, 0] * x_mag
+            y = u[:, 1] * y_mag
+            for k, (sx, sy) in enumerate(((1, 1), (-1, 1), (1, -1), (-1, -1))):
+                ind = slice(k*num_parts_quad + j0, k*num_parts_quad + j0 + len(u))
+                self.x_coords[0, ind] = sx * x
+                self.y_coords[0, ind] = sy * y
         self.bx_coords[0, :] = 0
         self.by_coords[0, :] = 0
 
@@ -150,3 +258,147 @@ class PlasmaE_Random(PlasmaE):
         The number of particles in the simulation.
         """
         return self._num_parts
+
+    @property
+    def seed(self):
+        """
+        The :class:`numpy.random.SeedSequence` the loading was drawn from.
+        """
+        return self._seed
+
+    @property
+    def method(self):
+        """
+        The sampling method, one of ``'random'``, ``'sobol'`` or ``'halton'``.
+        """
+        return self._method
+
+
+class PlasmaE_Sheath(PlasmaE):
+    """
+    Plasma electrons coordinates for `num_parts` particles within a radius :math:`r_{max}`, concentrated near the expected sheath radius.
+
+    A fraction ``fraction`` of the particles is drawn from a Gaussian ring of radius ``r_sheath`` and width ``width``, the rest uniformly over the disc. :attr:`weights` make the loading represent a uniform plasma.
+    """
+    def __init__(self, num_parts, r_sheath, width, r_max, PlasmaParams, fraction=0.5, seed=None):
+        num_parts_quad = int(num_parts/4)
+        super().__init__(
+            PlasmaParams = PlasmaParams,
+            num_parts    = num_parts_quad * 4
+            )
+        self._r_sheath = r_sheath
+        self._width    = width
+        self._r_max    = r_max
+        self._fraction = fraction
+        self._area     = _np.pi * r_max**2
+        rng = _np.random.default_rng(seed)
+
+        # ======================================
+        # Draw radii from the ring or the disc
+        # ======================================
+        ring = rng.random(num_parts_quad) < fraction
+        r = r_max * _np.sqrt(rng.random(num_parts_quad))
+        lo, hi = -r_sheath/width, (r_max-r_sheath)/width
+        r[ring] = _spst.truncnorm.rvs(lo, hi, loc=r_sheath, scale=width, size=_np.sum(ring), random_state=rng)
+
+        theta = rng.random(num_parts_quad) * _np.pi/2
+        x = r * _np.cos(theta)
+        y = r * _np.sin(theta)
+
+        # ======================================
+        # Weight by uniform over sampled density
+        # ======================================
+        p_disc = 1 / (_np.pi * r_max**2)
+        norm = (_spp.erf(hi/_np.sqrt(2)) - _spp.erf(lo/_np.sqrt(2))) / 2
+        p_ring = _np.exp(-(r-r_sheath)**2 / (2*width**2)) / (_np.sqrt(2*_np.pi) * width * norm) / (2*_np.pi*r)
+        w = p_disc / ((1-fraction) * p_disc + fraction * p_ring)
+
+        # ======================================
+        # Set initial conditions
+        # ======================================
+        self.x_coords[0, :] = _np.concatenate((x , -x , x  , -x))
+        self.y_coords[0, :] = _np.concatenate((y , y  , -y , -y))
+        self.bx_coords[0, :] = 0
+        self.by_coords[0, :] = 0
+        self.weights = _np.tile(w, 4)
+
+    @property
+    def r_sheath(self):
+        """
+        Radius :math:`r_{sheath}` particles are concentrated around.
+        """
+        return self._r_sheath
+
+    @property
+    def width(self):
+        """
+        Gaussian width of the concentration around :math:`r_{sheath}`.
+        """
+        return self._width
+
+    @property
+    def r_max(self):
+        """
+        Radius :math:`r_{max}` of the loaded disc.
+        """
+        return self._r_max
+
+    @property
+    def fraction(self):
+        """
+        Fraction of particles concentrated around :math:`r_{sheath}`.
+        """
+        return self._fraction
+
+
+def spawn(seed, n):
+    """
+    Returns ``n`` independent :class:`numpy.random.SeedSequence` streams derived from ``seed``, e.g. one per run of a parallel scan.
+    """
+    if not isinstance(seed, _np.random.SeedSequence):
+        seed = _np.random.SeedSequence(seed)
+    return seed.spawn(n)
+
+
+def uniform_chunks(n, seed=None, method='random', chunk=2**20, d=2):
+    """
+    Generates ``n`` points uniform in the unit hypercube of dimension ``d``, yielding ``(j0, u)`` for successive blocks ``u`` of at most ``chunk`` points beginning at point ``j0``.
+
+    With ``method='random'`` every block has its own stream spawned from ``seed``; with ``'sobol'`` or ``'halton'`` every block is a scrambled engine seeded from ``seed`` and fast-forwarded to ``j0``. Either way the points depend only on ``seed``, not on ``chunk``, so blocks can be generated independently by separate workers.
+    """
+    if method not in _methods:
+        raise ValueError('Method must be one of {}, got: {}'.format(_methods, method))
+    if not isinstance(seed, _np.random.SeedSequence):
+        seed = _np.random.SeedSequence(seed)
+
+    # ======================================
+    # Spawn streams on a fixed block size so
+    # the points do not depend on chunk
+    # ======================================
+    block = 2**16
+    if method == 'random':
+        chunk = max(block, chunk - chunk % block)
+        streams = seed.spawn(-(-n // block))
+    else:
+        engine_seed = seed.generate_state(1)[0]
+
+    for j0 in range(0, n, chunk):
+        m = min(chunk, n - j0)
+        if method == 'random':
+            u = _np.empty((m, d))
+            for k0 in range(0, m, block):
+                rng = _np.random.default_rng(streams[(j0+k0) // block])
+                u[k0:k0+block] = rng.random((min(block, m-k0), d))
+        else:
+            Engine = _qmc.Sobol if method == 'sobol' else _qmc.Halton
+            engine = Engine(d=d, scramble=True, seed=engine_seed)
+            if j0 > 0:
+                engine.fast_forward(j0)
+            # ======================================
+            # Arbitrary particle counts are fine,
+            # the sequence is never rebalanced
+            # ======================================
+            with _warnings.catch_warnings():
+                _warnings.simplefilter('ignore', UserWarning)
+                u = engine.random(m)
+        yield j0, u
@@ -2,76 +2,121 @@ from .support import _timestamp2filename
 from .support import Timestamp as _Timestamp
 from .support import _write_arrays
 from .support import _write_scalars
-from .support import _write_data
+from .support import _append_arrays
+from .support import _append_scalars
+from .support import _LazyModule
+from .candidates import Candidates as _Candidates
+from . import __version__ as _version
 import numpy as _np
-import scisalt as _ss
-import skimage.measure as _skmeas
-import skimage.morphology as _skmorph
-import skimage.segmentation as _skseg
-import skimage.transform as _sktrans
-import skimage.draw as _skdraw
+import numpy.lib.recfunctions as _rfn
 import time as _time
-import h5py as _h5
-import pkg_resources as _pkg_resources
+import hashlib as _hashlib
+import json as _json
 import logging as _logging
-import ipdb as pdb
+import multiprocessing as _mp
 
-_version = _pkg_resources.get_distribution('blowout').version
 _logger = _logging.getLogger(__name__)
 
-import ipdb
+_h5      = _LazyModule('h5py')
+_ss      = _LazyModule('scisalt')
+_ndi     = _LazyModule('scipy.ndimage')
+
+
+_methods = ('hough', 'sectors')
+
+# ======================================
+# Parameters each method reads; the
+# sector estimator keeps its single row
+# ======================================
+_method_params = {
+    'hough'   : ('bins', 'closing', 'threshold', 'hist_extent', 'top_k', 'score', 'debug'),
+    'sectors' : ('num_sectors', )
+    }
+
+# ======================================
+# Bump when analysis results change for
+# the same parameters
+# ======================================
+_analysis_version = 2
 
 
 class PlasmaIons(_Timestamp):
-    def __init__(self, PlasmaParams):
+    """
+    Finds the ion cavity left behind by the plasma electrons in each slice.
+
+    The cavity is found either by histogramming the particles and fitting the boundary of the central region with a Hough transform (``method='hough'``), or directly from the inner envelope of the particles in ``num_sectors`` angular sectors about the axis (``method='sectors'``), which needs no image.
+
+    Hough histograms have ``bins`` bins along each axis, the cavity is closed with a ``closing`` by ``closing`` square and the Hough transform uses ``threshold``. By default every slice is histogrammed over its own particle range; with ``hist_extent``, all slices share one grid spanning ``[x_min, x_max, y_min, y_max]`` (particles outside are ignored), or with ``hist_extent='initial'`` the range of the first slice analyzed. On a shared grid the bin edges, center and pixel-to-physical transform are computed once and images of different slices can be compared bin by bin. Only the ``top_k`` candidates of each slice with the highest ``score`` are kept, without the per-candidate accumulator arrays; ``top_k=None`` keeps every candidate. With ``debug``, the full result set of every slice is kept instead.
+    """
+    def __init__(self, PlasmaParams, method='hough', num_sectors=64, top_k=1, score='count_density', debug=False, bins=200, closing=3, threshold=5, hist_extent=None):
         super().__init__()
+        if method not in _methods:
+            raise ValueError('Method must be one of {}, got: {}'.format(_methods, method))
+
         self._PlasmaParams = PlasmaParams
+        self._method       = method
+        self._num_sectors  = num_sectors
+        self._top_k        = top_k
+        self._score        = score
+        self._debug        = debug
+        self._bins         = bins
+        self._closing      = closing
+        self._threshold    = threshold
+        self._hist_extent  = hist_extent
+        self._grid         = None
+        if hist_extent is not None and not isinstance(hist_extent, str):
+            self._grid = _HistGrid(hist_extent, bins)
         self._step_ind     = 0
 
         num_steps = PlasmaParams.num_steps
 
-        self._img            = _np.empty(num_steps, dtype=object)
-        self._xind           = _np.empty(num_steps)
-        self._yind           = _np.empty(num_steps)
-        self._closed_ellipse = _np.empty(num_steps, dtype=object)
-        self._prop           = _np.empty(num_steps, dtype=object)
-        self._bounds         = _np.empty(num_steps, dtype=object)
-        self._results        = _np.empty(num_steps, dtype=object)
+        self._img             = _np.empty(num_steps, dtype=object)
+        self._extent          = _np.empty((num_steps, 4))
+        self._xind            = _np.empty(num_steps)
+        self._yind            = _np.empty(num_steps)
+        self._closed_ellipse  = _np.empty(num_steps, dtype=object)
+        self._bounds          = _np.empty(num_steps, dtype=object)
+        self._results         = _np.empty(num_steps, dtype=object)
+        self._overlays        = None
+        self._extractor       = None
+        self._stack_extractor = None
 
-    def _save_results(self):
-        results = self._results
+    def _resize(self):
         # ======================================
-        # Get names in results
+        # Fit per-slice storage to the current
+        # xi_bubble
         # ======================================
-        names = self._results[0].dtype.names
+        num_steps = self.PlasmaParams.num_steps
+        for name in ('_img', '_extent', '_xind', '_yind', '_closed_ellipse', '_bounds', '_results'):
+            old = getattr(self, name)
+            new = _np.empty((num_steps, ) + old.shape[1:], dtype=old.dtype)
+            common = min(num_steps, old.shape[0])
+            new[:common] = old[:common]
+            setattr(self, name, new)
 
-        # ======================================
-        # Create dict for flattened array
-        # ======================================
-        dict_layout = {'names': [], 'formats': []}
-        for name in names:
-            dict_layout['names'].append(name)
-            maxlen = 0
-            for result in results:
-                res_name_len = len(result[name])
-                if res_name_len > maxlen:
-                    maxlen = res_name_len
+        self._step_ind = min(self._step_ind, num_steps)
+        if getattr(self, '_results_flat', None) is not None:
+            self._results_flat = self._results_flat[:num_steps]
+        self._overlays = None
 
-            if res_name_len > 1:
-                dict_layout['formats'].append(object)
-            else:
-                dict_layout['formats'].append(results[0][name].dtype)
+    @property
+    def num_analyzed(self):
+        """
+        Number of slices analyzed so far.
+        """
+        return self._step_ind
 
-        results_flat = _np.zeros(len(results), dtype=dict_layout)
+    def _save_results(self, start=0):
         # ======================================
-        # Create flattened array
+        # Candidates of all slices as columns,
+        # keeping earlier slices already saved
         # ======================================
-        for i, result in enumerate(results):
-            for name in names:
-                results_flat[name][i] = result[name]
-        
-        ipdb.set_trace()
+        results_flat = _Candidates.from_results(self._results[start:])
+        if start > 0:
+            results_flat = self._results_flat[:start].concat(results_flat)
+
         self._results_flat = results_flat
+        self._overlays     = None
 
     @property
     def PlasmaParams(self):
@@ -80,16 +125,112 @@ class PlasmaIons(_Timestamp):
         """
         return self._PlasmaParams
 
+    @property
+    def method(self):
+        """
+        The cavity estimator used, ``'hough'`` or ``'sectors'``.
+        """
+        return self._method
+
+    @property
+    def num_sectors(self):
+        """
+        Number of angular sectors used by the ``'sectors'`` estimator.
+        """
+        return self._num_sectors
+
+    @property
+    def bins(self):
+        """
+        Number of histogram bins along each axis for the ``'hough'`` estimator.
+        """
+        return self._bins
+
+    @property
+    def closing(self):
+        """
+        Side of the square element closing gaps in the cavity for the ``'hough'`` estimator.
+        """
+        return self._closing
+
+    @property
+    def threshold(self):
+        """
+        Accumulator threshold of the Hough transform.
+        """
+        return self._threshold
+
+    @property
+    def hist_extent(self):
+        """
+        Extent of the histogram grid shared by all slices, ``'initial'`` if not yet taken from the first slice, or ``None`` for a grid per slice.
+        """
+        if self._grid is not None:
+            return self._grid.extent
+        return self._hist_extent
+
+    @property
+    def analysis_params(self):
+        """
+        The parameters that determine the analysis results, as a dict: the ``method`` and the parameters that method reads.
+        """
+        params = {
+            'method'      : str(self.method),
+            'num_sectors' : int(self.num_sectors),
+            'bins'        : int(self.bins),
+            'closing'     : int(self.closing),
+            'threshold'   : float(self.threshold),
+            'top_k'       : int(self.top_k) if self.top_k is not None else None,
+            'score'       : str(self.score),
+            'debug'       : bool(self.debug),
+            'hist_extent' : self._hist_extent if self._hist_extent is None or isinstance(self._hist_extent, str) else [float(v) for v in self._hist_extent]
+            }
+        return {name: params[name] for name in ('method', ) + _method_params[self.method]}
+
+    @property
+    def analysis_key(self):
+        """
+        Key naming this analysis: the analysis version and a hash of :attr:`analysis_params`.
+        """
+        params = _json.dumps(self.analysis_params, sort_keys=True)
+        return 'v{}-{}'.format(_analysis_version, _hashlib.sha1(params.encode()).hexdigest()[:12])
+
+    @property
+    def top_k(self):
+        """
+        Number of candidates kept per slice, or ``None`` for all.
+        """
+        return self._top_k
+
+    @property
+    def score(self):
+        """
+        Result field ranking the candidates, highest first.
+        """
+        return self._score
+
+    @property
+    def debug(self):
+        """
+        Whether the full result set of every slice is kept.
+        """
+        return self._debug
+
     def _set_timestamp(self, timestamp):
         self._timestamp = timestamp
         self._PlasmaParams._set_timestamp(timestamp)
 
-    def write(self, filename=None):
+    def write(self, filename=None, append=False):
         """
 
         Write all of the particles and plasma parameters to a file.
+
+        With ``append``, the file must already hold the earlier slices of this run; only the new slices are written to it.
         """
         filename = _timestamp2filename(self, ftype='ions', filename=filename)
+        if append:
+            self._append(filename)
+            return
 
         # ======================================
         # Create flat results
@@ -103,45 +244,191 @@ class PlasmaIons(_Timestamp):
             # ipdb.set_trace()
             f.attrs['version'] = _version
             # f.attrs.create(name='version', data=_version)
-            
-            gdata = f.create_group('data')
+            self._write_group(f)
 
-            # ======================================
-            # Write data
-            # ======================================
+    def _write_group(self, group):
+        """
+        Writes the ``data`` and ``metadata`` of this analysis into ``group``, a file or a group within one.
+        """
+        gdata = group.create_group('data')
+
+        # ======================================
+        # Write data
+        # ======================================
+        if self.method == 'hough':
             dxind           = _write_scalars(group=gdata, name='xind', data=self._xind)          # noqa
-            dyind           = _write_scalars(group=gdata, name='yind', data=self._xind)          # noqa
+            dyind           = _write_scalars(group=gdata, name='yind', data=self._yind)          # noqa
+            dextent         = _write_scalars(group=gdata, name='extent', data=self._extent)      # noqa
             dimg            = _write_arrays(group=gdata , name='img'            , data=self._img            )  # noqa
             dclosed_ellipse = _write_arrays(group=gdata , name='closed_ellipse' , data=self._closed_ellipse )  # noqa
             dbounds         = _write_arrays(group=gdata , name='bounds'         , data=self._bounds         )  # noqa
 
-            gresults_flat = gdata.create_group('results_flat')
-            names = self._results_flat.dtype.names
-            for name in names:
-                _write_data(gresults_flat, name, self._results_flat[name])
+        self._results_flat.write(gdata.create_group('results_flat'))
 
-            gmeta = f.create_group('metadata')  # noqa
-            # gmeta.attrs.create(name='num_parts' , data=self.num_parts )
+        gmeta = group.create_group('metadata')  # noqa
+        # gmeta.attrs.create(name='num_parts' , data=self.num_parts )
+        gmeta.attrs['method'] = self.method
+        gmeta.attrs.create(name='num_sectors', data=self.num_sectors)
+        gmeta.attrs['score'] = self.score
+        gmeta.attrs['debug'] = self.debug
+        gmeta.attrs.create(name='bins', data=self.bins)
+        gmeta.attrs.create(name='closing', data=self.closing)
+        gmeta.attrs.create(name='threshold', data=self.threshold)
+        if self.top_k is not None:
+            gmeta.attrs.create(name='top_k', data=self.top_k)
+        if self._grid is not None:
+            gmeta.attrs.create(name='hist_extent', data=self._grid.extent)
+            gmeta.attrs['hist_extent_initial'] = isinstance(self._hist_extent, str)
+        gmeta.attrs['analysis_key'] = self.analysis_key
 
-    def draw_ellipse(self, i=0):
+    def _append(self, filename):
+        with _h5.File(filename, 'a') as f:
+            gdata = f['data']
+            gresults_flat = gdata['results_flat']
+            if gresults_flat.attrs.get('layout') != 'columnar':
+                raise ValueError('Cannot append to results stored per slice by an earlier version: {}'.format(filename))
+
+            # ======================================
+            # Only slices not yet in the file
+            # ======================================
+            start = _Candidates.num_stored(gresults_flat)
+            self._save_results(start=start)
+            stop = self.PlasmaParams.num_steps
+
+            if self.method == 'hough':
+                _append_scalars(group=gdata , name='xind'           , data=self._xind[start:stop]           )
+                _append_scalars(group=gdata , name='yind'           , data=self._yind[start:stop]           )
+                _append_scalars(group=gdata , name='extent'         , data=self._extent[start:stop]         )
+                _append_arrays(group=gdata  , name='img'            , data=self._img[start:stop]            )
+                _append_arrays(group=gdata  , name='closed_ellipse' , data=self._closed_ellipse[start:stop] )
+                _append_arrays(group=gdata  , name='bounds'         , data=self._bounds[start:stop]         )
+
+            self._results_flat.append(gresults_flat)
+
+    def ellipse(self, i=0):
+        """
+        The best-fit cavity ellipse of slice ``i`` in physical units.
+
+        Returns ``xc, yc, a, b, orientation``, where ``a`` is the major semi-axis and ``orientation`` is the angle of the major axis from the :math:`x` axis. Hough results are converted from pixels using the histogram extent of the slice, so the semi-axes of tilted ellipses are approximate when the bins are not square.
+        """
+        results = self._results[i]
+        if results is None:
+            results = self._results_flat[i]
+
+        score = _np.atleast_1d(results[self.score])
+        if score.size == 0:
+            return (_np.nan, ) * 5
+        j = _np.argmax(score)
+
+        xc          = _np.atleast_1d(results['xc'])[j]
+        yc          = _np.atleast_1d(results['yc'])[j]
+        a           = _np.atleast_1d(results['a'])[j]
+        b           = _np.atleast_1d(results['b'])[j]
+        orientation = _np.atleast_1d(results['orientation'])[j]
+
+        if self.method == 'sectors':
+            return xc, yc, a, b, orientation
+
+        return _hough2phys(xc, yc, a, b, orientation, self._extent[i], self._img[i].shape)
+
+    def area(self, i=0):
+        """
+        Area of the best-fit cavity ellipse of slice ``i``, or NaN if none was found.
+        """
+        xc, yc, a, b, orientation = self.ellipse(i)
+        return _np.pi * a * b
+
+    def _best_ellipses(self):
+        # ======================================
+        # Highest count density per slice, NaN
+        # where a slice has no candidates
+        # ======================================
         data = self._results_flat
-        j = _np.argmax(data['count_density'][i])
-        x, y = _skdraw.ellipse_perimeter(
-            cy          = data['yc'][i][j].astype('int'),
-            cx          = data['xc'][i][j].astype('int'),
-            yradius     = data['a'][i][j].astype('int'),
-            xradius     = data['b'][i][j].astype('int'),
-            orientation = data['orientation'][i][j]
-            )
-        
-        bounds_int = self._bounds[i].astype('int')
-        
-        bounds_int[x, y] = 2
-    
-        _ss.matplotlib.Imshow_Slider(bounds_int)
+        names = ('xc', 'yc', 'a', 'b', 'orientation')
+        best = _np.full((len(data), len(names)), _np.nan)
+        rows = data.best(self.score)
+        filled = rows >= 0
+        for k, name in enumerate(names):
+            best[filled, k] = data.column(name)[rows[filled]]
+
+        return best
+
+    def render_ellipses(self):
+        """
+        Boundary images of every slice with the best-fit ellipse drawn on them, as a ``(steps, H, W)`` array.
+
+        Boundary pixels are 1 and ellipse pixels 2; slices without a boundary image, such as the empty ones at the head of the bubble, are left blank. The stack is rasterized in one pass over all slices and cached until the results change.
+        """
+        if self._overlays is not None:
+            return self._overlays
+
+        if self.method != 'hough':
+            raise ValueError('Only Hough results have boundary images to draw on.')
+
+        shapes = [_np.shape(bounds) for bounds in self._bounds if bounds is not None]
+        if not shapes:
+            raise ValueError('No slice has a boundary image.')
+        steps = len(self._bounds)
+        H, W = shapes[0]
+        overlays = _np.zeros((steps, H, W), dtype=_np.uint8)
+        has_bounds = _np.zeros(steps, dtype=bool)
+        for i, bounds in enumerate(self._bounds):
+            if bounds is not None:
+                overlays[i] = bounds
+                has_bounds[i] = True
+
+        # ======================================
+        # Sample every perimeter at once
+        # ======================================
+        xc, yc, a, b, orientation = self._best_ellipses().T
+        valid = _np.isfinite(a) & has_bounds
+        num_pts = int(4*_np.pi*_np.nanmax(a)) + 8 if _np.any(valid) else 0
+        t = _np.linspace(0, 2*_np.pi, num_pts, endpoint=False)
+
+        theta = -orientation[valid, None]
+        cos_t, sin_t = _np.cos(t), _np.sin(t)
+        rows = yc[valid, None] + a[valid, None]*cos_t*_np.cos(theta) - b[valid, None]*sin_t*_np.sin(theta)
+        cols = xc[valid, None] + a[valid, None]*cos_t*_np.sin(theta) + b[valid, None]*sin_t*_np.cos(theta)
+
+        rows = _np.round(rows).astype(int)
+        cols = _np.round(cols).astype(int)
+        inside = (rows >= 0) & (rows < H) & (cols >= 0) & (cols < W)
+        slices = _np.broadcast_to(_np.flatnonzero(valid)[:, None], rows.shape)
+
+        overlays[slices[inside], rows[inside], cols[inside]] = 2
+
+        self._overlays = overlays
+        return overlays
+
+    def export_ellipses(self, filename, fps=10):
+        """
+        Writes the images from :meth:`render_ellipses` to ``filename``.
+
+        A ``filename`` with a format field, such as ``'ellipse_{:04d}.png'``, writes one image per slice; anything else is written as a video with ``fps`` frames per second through :mod:`matplotlib.animation`.
+        """
+        import matplotlib.pyplot as _plt
+        overlays = self.render_ellipses()
+
+        if '{' in filename:
+            for i, overlay in enumerate(overlays):
+                _plt.imsave(filename.format(i), overlay, vmin=0, vmax=2)
+            return
+
+        import matplotlib.animation as _animation
+        fig = _plt.figure()
+        img = _plt.imshow(overlays[0], vmin=0, vmax=2)
+        writer = _animation.FFMpegWriter(fps=fps)
+        with writer.saving(fig, filename, dpi=100):
+            for overlay in overlays:
+                img.set_data(overlay)
+                writer.grab_frame()
+        _plt.close(fig)
+
+    def draw_ellipse(self, i=0):
+        _ss.matplotlib.Imshow_Slider(self.render_ellipses()[i])
         # plt.show()
 
-    def add_ion_ellipse(self, x, y, step_ind=None):
+    def add_ion_ellipse(self, x, y, step_ind=None, weights=None):
         t = _time.perf_counter()
         _logger.debug('Finding ellipse...')
         # print('Finding ellipse...')
@@ -150,14 +437,49 @@ class PlasmaIons(_Timestamp):
             self._step_ind = step_ind + 1
             # print('Step: {}'.format(step_ind))
 
+        if self.method == 'sectors':
+            results = _sector_ellipse(x, y, num_sectors=self.num_sectors)
+        else:
+            results = self._hough_ellipse(x, y, step_ind, weights=weights)
+
+        _logger.debug('Found: {} s'.format(_time.perf_counter()-t))
+        # print('Found: {} s'.format(_time.perf_counter()-t))
+
+        if not self.debug:
+            results = self._retain(results)
+        self._results[step_ind] = results
+    
+        return results
+
+    def _retain(self, results):
+        # ======================================
+        # Best top_k rows, scalar fields only
+        # ======================================
+        if self.top_k is not None and len(results) > self.top_k:
+            order = _np.argsort(-results[self.score], kind='stable')
+            results = results[order[:self.top_k]]
+
+        names = [name for name in results.dtype.names if results.dtype[name] != _np.dtype(object)]
+        if len(names) < len(results.dtype.names):
+            results = _rfn.repack_fields(results[names])
+
+        return results
+
+    def _hough_ellipse(self, x, y, step_ind, weights=None):
         # ======================================
         # Histogram particles
         # ======================================
         # ind = _np.abs(x) < 3
         # x = x[ind]
         # y = y[ind]
-        img, extent = _ss.matplotlib.hist2d(x, y, bins=200, plot=False)
+        if self._hist_extent is None:
+            img, extent = _ss.matplotlib.hist2d(x, y, bins=self.bins, plot=False, weights=weights)
+        else:
+            grid = self._shared_grid(x, y)
+            img = grid.deposit(x[None], y[None], weights=weights)[0]
+            extent = grid.extent
         self._img[step_ind] = img
+        self._extent[step_ind] = extent
         
         # ======================================
         # Find index of center
@@ -167,46 +489,423 @@ class PlasmaIons(_Timestamp):
         self._yind[step_ind] = yind
         
         # ======================================
-        # Find ellipse corresponding to center
-        # region
+        # Find the cavity around the center,
+        # closed and outlined in reused buffers
         # ======================================
-        labels = _skmeas.label(img)
-        cent_label = labels[xind, yind]
-        ellipse = (labels == cent_label)
-        
+        if self._extractor is None or self._extractor.shape != img.shape:
+            self._extractor = _CavityExtractor(img.shape, closing=self.closing)
+        ellipse, bounds, centroid = self._extractor(img, xind, yind)
+        self._closed_ellipse[step_ind] = ellipse.copy()
+        self._bounds[step_ind] = bounds.copy()
+
         # ======================================
-        # Find ellipse closing (smooth gaps)
+        # Find ellipse
         # ======================================
-        selem = _skmorph.square(3)
-        closed_ellipse = _skmorph.binary_closing(ellipse, selem=selem)
-        self._closed_ellipse[step_ind] = ellipse
-        
+        xmean, ymean = _np.array(centroid)*2
+        results = _fit_hough((bounds, xmean, ymean, self.threshold))
+        # results = _ss.scipy.hough_ellipse(bounds, threshold=1)
+
+        return results
+
+    def analyze(self, x, y, weights=None, start=0, processes=None, chunk=64):
+        """
+        Analyzes many slices at once, such as all of a stored run: ``x`` and ``y`` hold one row of particle coordinates per slice (e.g. :attr:`blowout.electrons.PlasmaE.x_coords`), and the results are stored for the slices from ``start`` on. Non-finite coordinates (dropped particles) are ignored.
+
+        For the ``'hough'`` estimator, ``chunk`` slices at a time are histogrammed into one 3D stack with a single deposit and their cavities extracted with stacked morphology. The ellipse fits run on a pool of ``processes`` worker processes, or in this process if ``processes`` is 1.
+        """
+        if self.method == 'sectors':
+            jobs = _sector_jobs(x, y, self.num_sectors)
+            fit = _fit_sectors
+        else:
+            jobs = self._cavity_jobs(x, y, weights, start, chunk)
+            fit = _fit_hough
+
         # ======================================
-        # Get properties of the ellipse
+        # Fit on the pool as stacks come in
         # ======================================
-        props = _skmeas.regionprops(closed_ellipse)
-        prop = props[0]
-        self._prop[step_ind] = prop
-        
+        if processes == 1:
+            fits = map(fit, jobs)
+            self._store_fits(fits, start)
+        else:
+            with _mp.Pool(processes=processes) as pool:
+                fits = pool.imap(fit, jobs, chunksize=max(1, chunk // 8))
+                self._store_fits(fits, start)
+
+        self._step_ind = max(self._step_ind, start + len(x))
+        self._overlays = None
+
+    def _shared_grid(self, x, y):
         # ======================================
-        # Find ellipse edges
+        # 'initial' takes the range of the
+        # first slice seen with particles
         # ======================================
-        bounds = _skseg.find_boundaries(closed_ellipse.astype('int'), mode='subpixel')
-        self._bounds[step_ind] = bounds
-        
+        if self._grid is None:
+            x, y = _np.atleast_2d(x, y)
+            finite = _np.isfinite(x) & _np.isfinite(y)
+            rows = _np.flatnonzero(_np.any(finite, axis=1))
+            if rows.size == 0:
+                return _HistGrid([0, 1, 0, 1], self.bins)
+            x, y = x[rows[0], finite[rows[0]]], y[rows[0], finite[rows[0]]]
+            extent = [_np.min(x), _np.max(x), _np.min(y), _np.max(y)]
+            self._grid = _HistGrid(extent, self.bins)
+        return self._grid
+
+    def _store_fits(self, fits, start):
+        for i, results in enumerate(fits, start):
+            if not self.debug:
+                results = self._retain(results)
+            self._results[i] = results
+
+    def _cavity_jobs(self, x, y, weights, start, chunk):
+        for c0 in range(0, len(x), chunk):
+            c1 = min(c0 + chunk, len(x))
+
+            # ======================================
+            # One deposit for the whole stack
+            # ======================================
+            if self._hist_extent is None:
+                imgs, extents = _hist2d_stack(x[c0:c1], y[c0:c1], self.bins, weights=weights)
+                inds = _np.array([_imgcenter(img, extent) for img, extent in zip(imgs, extents)])
+            else:
+                grid = self._shared_grid(x[c0:c1], y[c0:c1])
+                imgs = grid.deposit(x[c0:c1], y[c0:c1], weights=weights)
+                extents = _np.broadcast_to(grid.extent, (c1-c0, 4))
+                inds = _np.broadcast_to(grid.center, (c1-c0, 2))
+
+            # ======================================
+            # Cavities of all slices in the stack
+            # ======================================
+            if self._stack_extractor is None or self._stack_extractor.shape != imgs.shape:
+                self._stack_extractor = _CavityExtractor(imgs.shape, closing=self.closing)
+            ellipses, bounds, centroids = self._stack_extractor(imgs, inds[:, 0], inds[:, 1])
+
+            for k, i in enumerate(range(start + c0, start + c1)):
+                self._img[i]            = imgs[k]
+                self._extent[i]         = extents[k]
+                self._xind[i]           = inds[k, 0]
+                self._yind[i]           = inds[k, 1]
+                self._closed_ellipse[i] = ellipses[k].copy()
+                self._bounds[i]         = bounds[k].copy()
+                yield self._bounds[i], centroids[0][k]*2, centroids[1][k]*2, self.threshold
+
+
+_sector_dtype = [
+    ('count_density' , _np.double),
+    ('xc'            , _np.double),
+    ('yc'            , _np.double),
+    ('a'             , _np.double),
+    ('b'             , _np.double),
+    ('orientation'   , _np.double)
+    ]
+
+
+def _sector_ellipse(x, y, num_sectors=64):
+    """
+    Fits an ellipse to the inner envelope of the particles at :math:`(x, y)`.
+
+    The envelope is the smallest particle radius in each of ``num_sectors`` angular sectors about the axis. Returns a single-row array with the same fields as the Hough results, in physical units; ``count_density`` is the number of sectors containing particles.
+    """
+    # ======================================
+    # Smallest radius per angular sector
+    # ======================================
+    r     = _np.hypot(x, y)
+    theta = _np.arctan2(y, x)
+
+    sector = ((theta + _np.pi) * (num_sectors / (2*_np.pi))).astype(int)
+    _np.clip(sector, 0, num_sectors-1, out=sector)
+
+    r_min = _np.full(num_sectors, _np.inf)
+    _np.minimum.at(r_min, sector, r)
+
+    # ======================================
+    # Envelope points at sector centers
+    # ======================================
+    filled = _np.isfinite(r_min)
+    theta_c = (_np.arange(num_sectors)[filled] + 0.5) * (2*_np.pi / num_sectors) - _np.pi
+    px = r_min[filled] * _np.cos(theta_c)
+    py = r_min[filled] * _np.sin(theta_c)
+
+    results = _np.zeros(1, dtype=_sector_dtype)
+    results[0] = (px.size, ) + tuple(_fit_ellipse(px, py))
+
+    return results
+
+
+def _fit_ellipse(px, py):
+    """
+    Least-squares ellipse through points :math:`(p_x, p_y)`.
+
+    Returns ``xc, yc, a, b, orientation``. Falls back to second moments of the points when there are too few of them or the conic fit is not an ellipse, and returns NaNs when there are fewer than two.
+    """
+    if px.size < 2:
+        return (_np.nan, ) * 5
+
+    if px.size >= 5:
         # ======================================
-        # Find ellipse
+        # Conic A x^2 + B xy + C y^2 + D x + E y = 1
         # ======================================
-        xmean, ymean = _np.array(prop.centroid)*2
-        results = _ss.scipy.hough_ellipse(bounds, xmean=xmean, ymean=ymean, threshold=5)
-        # results = _ss.scipy.hough_ellipse(bounds, threshold=1)
+        M = _np.column_stack((px**2, px*py, py**2, px, py))
+        A, B, C, D, E = _np.linalg.lstsq(M, _np.ones(px.size), rcond=None)[0]
 
-        _logger.debug('Found: {} s'.format(_time.perf_counter()-t))
-        # print('Found: {} s'.format(_time.perf_counter()-t))
+        if B**2 - 4*A*C < 0:
+            Q = _np.array([[A, B/2], [B/2, C]])
+            xc, yc = _np.linalg.solve(2*Q, (-D, -E))
+            F0 = 1 - (D*xc + E*yc)/2
+            lam, vec = _np.linalg.eigh(Q)
+            if F0/lam[0] > 0 and F0/lam[1] > 0:
+                a, b = _np.sqrt(F0/lam)
+                return xc, yc, a, b, _np.arctan(vec[1, 0]/vec[0, 0]) if vec[0, 0] != 0 else _np.pi/2
 
-        self._results[step_ind] = results
-    
-        return results
+    # ======================================
+    # Points spread evenly on an ellipse have
+    # variance of half the squared semi-axis
+    # ======================================
+    xc, yc = _np.mean(px), _np.mean(py)
+    lam, vec = _np.linalg.eigh(_np.cov(px, py))
+    lam = _np.maximum(lam, 0)
+    b, a = _np.sqrt(2*lam)
+    return xc, yc, a, b, _np.arctan(vec[1, 1]/vec[0, 1]) if vec[0, 1] != 0 else _np.pi/2
+
+
+def _hough2phys(xc, yc, a, b, orientation, extent, bins):
+    """
+    Converts Hough ellipses to physical units, returning ``xc, yc, a, b, orientation`` as for :meth:`PlasmaIons.ellipse`.
+    """
+    # ======================================
+    # Hough works on the subpixel boundary
+    # image: rows are x, columns are y, and
+    # each histogram bin is two pixels wide
+    # ======================================
+    dx = (extent[1] - extent[0]) / bins[0]
+    dy = (extent[3] - extent[2]) / bins[1]
+
+    theta = -orientation
+    cos, sin = _np.cos(theta), _np.sin(theta)
+
+    return (
+        extent[0] + (yc/2 + 0.5) * dx,
+        extent[2] + (xc/2 + 0.5) * dy,
+        a/2 * _np.hypot(cos*dx, sin*dy),
+        b/2 * _np.hypot(sin*dx, cos*dy),
+        _np.arctan(_np.tan(theta))
+        )
+
+
+class _CavityExtractor(object):
+    """
+    Finds the cavity of a histogram: the 8-connected region of bins equal to the seed bin, or every empty bin if the seed bin is empty (as labelling with background 0 gives), closed with a ``closing`` by ``closing`` square, its subpixel boundary and its centroid.
+
+    ``shape`` is ``(H, W)`` for one image or ``(n, H, W)`` for a stack of images handled together, each with its own seed and never connected to its neighbors. The work buffers are allocated once and overwritten by every call, so callers copy what they keep.
+    """
+    def __init__(self, shape, closing=3):
+        H, W = shape[-2:]
+        lead = (1, ) * (len(shape)-2)
+        self._shape     = tuple(shape)
+        self._closing   = closing
+        self._connect   = _np.ones(lead + (3, 3), dtype=bool)
+        self._footprint = _np.ones(lead + (closing, closing), dtype=bool)
+        self._same      = _np.empty(shape, dtype=bool)
+        self._seed      = _np.empty(shape, dtype=bool)
+        self._mask      = _np.empty(shape, dtype=bool)
+        self._dilated   = _np.empty(shape, dtype=bool)
+        self._closed    = _np.empty(shape, dtype=bool)
+        self._bounds    = _np.empty(self._shape[:-2] + (2*H-1, 2*W-1), dtype=bool)
+        self._rows      = _np.arange(H)
+        self._cols      = _np.arange(W)
+
+    @property
+    def shape(self):
+        """
+        Shape of the images handled.
+        """
+        return self._shape
+
+    @property
+    def closing(self):
+        """
+        Side of the square closing element.
+        """
+        return self._closing
+
+    def __call__(self, img, xind, yind):
+        """
+        Returns the unclosed cavity mask, the subpixel boundary of the closed cavity, and the ``(row, col)`` centroid of the closed cavity. For a stack, ``xind`` and ``yind`` hold one seed per image.
+        """
+        if len(self._shape) == 2:
+            seed = (xind, yind)
+        else:
+            seed = (_np.arange(self._shape[0]), xind, yind)
+
+        # ======================================
+        # Flood fill from the seed only
+        # ======================================
+        _np.equal(img, _np.asarray(img[seed])[..., None, None], out=self._same)
+        self._seed[...] = False
+        self._seed[seed] = True
+        _ndi.binary_dilation(self._seed, structure=self._connect, iterations=0, mask=self._same, output=self._mask)
+
+        # ======================================
+        # Empty bins are all one background
+        # region, connected or not
+        # ======================================
+        empty = _np.asarray(img[seed]) == 0
+        _np.copyto(self._mask, self._same, where=empty[..., None, None])
+
+        # ======================================
+        # Closing (smooth gaps)
+        # ======================================
+        _ndi.binary_dilation(self._mask, structure=self._footprint, output=self._dilated)
+        _ndi.binary_erosion(self._dilated, structure=self._footprint, border_value=1, output=self._closed)
+
+        # ======================================
+        # Subpixel boundary: the interstitial
+        # pixels between differing neighbors
+        # ======================================
+        c = self._closed
+        b = self._bounds
+        b[..., 0::2, 0::2] = False
+        _np.not_equal(c[..., :, :-1], c[..., :, 1:], out=b[..., 0::2, 1::2])
+        _np.not_equal(c[..., :-1, :], c[..., 1:, :], out=b[..., 1::2, 0::2])
+        corner = b[..., 1::2, 1::2]
+        _np.logical_or(b[..., 0:-1:2, 1::2], b[..., 2::2, 1::2], out=corner)
+        _np.logical_or(corner, b[..., 1::2, 0:-1:2], out=corner)
+        _np.logical_or(corner, b[..., 1::2, 2::2], out=corner)
+
+        # ======================================
+        # Centroid of the closed cavity
+        # ======================================
+        num = _np.count_nonzero(c, axis=(-2, -1))
+        centroid = (_np.dot(_np.count_nonzero(c, axis=-1), self._rows) / num, _np.dot(_np.count_nonzero(c, axis=-2), self._cols) / num)
+
+        return self._mask, b, centroid
+
+
+def _fit_hough(args):
+    bounds, xmean, ymean, threshold = args
+    return _ss.scipy.hough_ellipse(bounds, xmean=xmean, ymean=ymean, threshold=threshold)
+
+
+def _sector_jobs(x, y, num_sectors):
+    for xi, yi in zip(x, y):
+        finite = _np.isfinite(xi) & _np.isfinite(yi)
+        yield xi[finite], yi[finite], num_sectors
+
+
+def _fit_sectors(args):
+    x, y, num_sectors = args
+    return _sector_ellipse(x, y, num_sectors=num_sectors)
+
+
+def _hist2d_stack(x, y, bins, weights=None):
+    """
+    Histograms every row of ``x`` and ``y`` over its own range as :func:`numpy.histogram2d` does, in one deposit.
+
+    Returns the ``(steps, bins, bins)`` stack and the ``(steps, 4)`` extents. Non-finite coordinates are ignored; a slice without finite coordinates gives an empty image over ``[0, 1, 0, 1]``.
+    """
+    steps = len(x)
+    finite = _np.isfinite(x) & _np.isfinite(y)
+    rows = _np.arange(steps)[:, None]
+
+    empty = ~_np.any(finite, axis=1)
+
+    index = _np.zeros(x.shape, dtype=_np.intp)
+    extents = _np.empty((steps, 4))
+    for axis, v in enumerate((x, y)):
+        # ======================================
+        # Same edges as numpy.histogram2d, which
+        # spans 0 to 1 for an empty slice
+        # ======================================
+        lo = _np.min(_np.where(finite, v, _np.inf), axis=1)
+        hi = _np.max(_np.where(finite, v, -_np.inf), axis=1)
+        lo[empty] = 0
+        hi[empty] = 1
+        same = lo == hi
+        lo[same] -= 0.5
+        hi[same] += 0.5
+        edges = _np.linspace(lo, hi, bins+1, axis=1)
+        extents[:, 2*axis]   = lo
+        extents[:, 2*axis+1] = hi
+
+        # ======================================
+        # Estimate the bin, then correct it
+        # against the edges as searchsorted would
+        # ======================================
+        v = _np.where(finite, v, lo[:, None])
+        ind = ((v - lo[:, None]) * (bins / (hi - lo))[:, None]).astype(_np.intp)
+        _np.clip(ind, 0, bins-1, out=ind)
+        ind -= v < edges[rows, ind]
+        ind += v >= edges[rows, ind+1]
+        _np.clip(ind, 0, bins-1, out=ind)
+
+        index = index * bins + ind
+
+    flat = (rows * bins**2 + index)[finite]
+    if weights is not None:
+        weights = _np.broadcast_to(weights, x.shape)[finite]
+    imgs = _np.bincount(flat, weights=weights, minlength=steps*bins**2).astype(float)
+
+    return imgs.reshape(steps, bins, bins), extents
+
+
+class _HistGrid(object):
+    """
+    A ``bins`` by ``bins`` histogram grid over a fixed ``extent = [x_min, x_max, y_min, y_max]``, with bin edges and center bin computed once.
+
+    Bins are those of :func:`numpy.histogram2d` with this range: the last bin along each axis includes its upper edge, and particles outside are ignored.
+    """
+    def __init__(self, extent, bins):
+        self._extent = _np.array(extent, dtype=float)
+        self._bins   = bins
+        self._edges  = [_np.linspace(self._extent[2*axis], self._extent[2*axis+1], bins+1) for axis in (0, 1)]
+        self._scale  = [bins / (self._extent[2*axis+1] - self._extent[2*axis]) for axis in (0, 1)]
+        self._center = _imgcenter(_np.empty((bins, bins)), self._extent)
+
+    @property
+    def extent(self):
+        """
+        The grid extent ``[x_min, x_max, y_min, y_max]``.
+        """
+        return self._extent
+
+    @property
+    def center(self):
+        """
+        Bin ``(xind, yind)`` holding the axis.
+        """
+        return self._center
+
+    def deposit(self, x, y, weights=None):
+        """
+        Histograms every row of ``x`` and ``y`` on the grid in one deposit, returning a ``(steps, bins, bins)`` stack.
+        """
+        bins = self._bins
+        inside = _np.ones(_np.shape(x), dtype=bool)
+        index = _np.zeros(_np.shape(x), dtype=_np.intp)
+        for axis, v in enumerate((x, y)):
+            edges = self._edges[axis]
+            with _np.errstate(invalid='ignore'):
+                inside &= (v >= edges[0]) & (v <= edges[-1])
+            v = _np.where(inside, v, edges[0])
+
+            # ======================================
+            # Estimate the bin, then correct it
+            # against the edges as searchsorted would
+            # ======================================
+            ind = ((v - edges[0]) * self._scale[axis]).astype(_np.intp)
+            _np.clip(ind, 0, bins-1, out=ind)
+            ind -= v < edges[ind]
+            ind += v >= edges[ind+1]
+            _np.clip(ind, 0, bins-1, out=ind)
+
+            index = index * bins + ind
+
+        steps = _np.shape(x)[0]
+        flat = (_np.arange(steps)[:, None] * bins**2 + index)[inside]
+        if weights is not None:
+            weights = _np.broadcast_to(weights, _np.shape(x))[inside]
+        imgs = _np.bincount(flat, weights=weights, minlength=steps*bins**2).astype(float)
+
+        return imgs.reshape(steps, bins, bins)
 
 
 def _imgcenter(img, extent):
@@ -1,18 +1,19 @@
 from .drive import Drive
+from .drive import MultiDrive
 from .electrons import PlasmaE
 from .simframework import SimFrame
 from .plasma import PlasmaParams
 from .ions import PlasmaIons
-import h5py as _h5
+from .ions import _HistGrid
+from .particles import ParticleState as _ParticleState
 import logging as _logging
-import pkg_resources as _pkg_resources
+from . import __version__ as _version
 from .support import _read_arrays
-from .support import _read_dict
+from .candidates import Candidates as _Candidates
+from .support import _LazyModule
 
 _logger  = _logging.getLogger(__name__)
-_version = _pkg_resources.get_distribution('blowout').version
-
-import pdb
+_h5      = _LazyModule('h5py')
 
 
 def loadSim(filebase):
@@ -66,10 +67,12 @@ def loadPlasmaParams(filename=None, gui=True):
     return plasmaparams
 
 
-def loadPlasmaIons(plasmaparams=None, filename=None, gui=True):
+def loadPlasmaIons(plasmaparams=None, filename=None, gui=True, analysis=None):
     """
     Load plasma ions.
 
+    With ``analysis``, loads the analysis stored under that key (see :mod:`blowout.reanalysis`) instead of the analysis made during the simulation; the key of the latter loads it too.
+
     Returns :class:`blowout.ions.PlasmaIons`.
     """
     if filename is None and gui:
@@ -78,40 +81,62 @@ def loadPlasmaIons(plasmaparams=None, filename=None, gui=True):
 
     with _h5.File(name=filename, mode='r') as f:
         _checkversion(f)
+        if analysis is None or analysis == f['metadata'].attrs.get('analysis_key', None):
+            group = f
+        else:
+            group = f['analyses'][analysis]
 
         # ======================================
         # Load metadata
         # ======================================
-        mattrs = f['metadata'].attrs
+        mattrs = group['metadata'].attrs
+        method      = mattrs.get('method', 'hough')
+        num_sectors = mattrs.get('num_sectors', 64)
+        top_k       = mattrs.get('top_k', None)
+        score       = mattrs.get('score', 'count_density')
+        debug       = bool(mattrs.get('debug', True))
+        bins        = mattrs.get('bins', 200)
+        closing     = mattrs.get('closing', 3)
+        threshold   = mattrs.get('threshold', 5)
+        hist_extent = mattrs.get('hist_extent', None)
+        if mattrs.get('hist_extent_initial', False):
+            initial = hist_extent
+            hist_extent = 'initial'
 
         # ======================================
-        # Load data
+        # Create class
         # ======================================
-        data = f['data']
+        plas = PlasmaIons(
+            PlasmaParams = plasmaparams,
+            method       = method,
+            num_sectors  = num_sectors,
+            top_k        = top_k,
+            score        = score,
+            debug        = debug,
+            bins         = bins,
+            closing      = closing,
+            threshold    = threshold,
+            hist_extent  = hist_extent
+            )
+        if isinstance(hist_extent, str):
+            plas._grid = _HistGrid(initial, bins)
 
-        img            = _read_arrays(data, 'img')
-        bounds         = _read_arrays(data, 'bounds')
-        closed_ellipse = _read_arrays(data, 'closed_ellipse')
-        xind           = data['xind'].value
-        yind           = data['yind'].value
-        results_flat = _read_dict(data, 'results_flat')
+        # ======================================
+        # Load data
+        # ======================================
+        data = group['data']
 
-    # ======================================
-    # Create class
-    # ======================================
-    plas = PlasmaIons(
-        PlasmaParams = plasmaparams,
-        )
+        if method == 'hough':
+            plas._img            = _read_arrays(data, 'img')
+            plas._bounds         = _read_arrays(data, 'bounds')
+            plas._closed_ellipse = _read_arrays(data, 'closed_ellipse')
+            plas._xind           = data['xind'][()]
+            plas._yind           = data['yind'][()]
+            if 'extent' in data:
+                plas._extent     = data['extent'][()]
 
-    # ======================================
-    # Put data into class
-    # ======================================
-    plas._img            = img
-    plas._bounds         = bounds
-    plas._closed_ellipse = closed_ellipse
-    plas._xind           = xind
-    plas._yind           = yind
-    plas._results_flat   = results_flat
+        plas._results_flat = _Candidates.read(data['results_flat'])
+        plas._step_ind     = len(plas._results_flat)
 
     # # ======================================
     # # Load coordinate data
@@ -124,10 +149,12 @@ def loadPlasmaIons(plasmaparams=None, filename=None, gui=True):
     return plas
 
 
-def loadPlasmaE(plasmaparams=None, filename=None, gui=True):
+def loadPlasmaE(plasmaparams=None, filename=None, gui=True, buffer=None):
     """
     Load plasma particles.
 
+    The coordinates are read into ``buffer`` if given, e.g. one from :meth:`blowout.particles.ParticleState.memmap` for runs that do not fit in memory. To reduce such runs without loading them, see :mod:`blowout.trajectories`.
+
     Returns :class:`blowout.electrons.PlasmaE`.
     """
     if filename is None and gui:
@@ -144,34 +171,54 @@ def loadPlasmaE(plasmaparams=None, filename=None, gui=True):
         num_parts = mattrs['num_parts']
 
         # ======================================
-        # Load data
+        # Create class
+        # ======================================
+        plas = PlasmaE(
+            PlasmaParams = plasmaparams,
+            num_parts    = num_parts,
+            buffer       = buffer
+            )
+        plas._area = mattrs.get('area', None)
+
+        # ======================================
+        # Load coordinate data
         # ======================================
         data = f['data']
 
-        x_coords  = data['x_coords'].value
-        y_coords  = data['y_coords'].value
-        bx_coords = data['bx_coords'].value
-        by_coords = data['by_coords'].value
+        if 'coords' in data:
+            _ParticleState.read(data['coords'], out=plas.coords)
+        else:
+            plas.x_coords  = data['x_coords'][()]
+            plas.y_coords  = data['y_coords'][()]
+            plas.bx_coords = data['bx_coords'][()]
+            plas.by_coords = data['by_coords'][()]
 
-    # ======================================
-    # Create class
-    # ======================================
-    plas = PlasmaE(
-        PlasmaParams = plasmaparams,
-        num_parts    = num_parts,
-        )
-
-    # ======================================
-    # Load coordinate data
-    # ======================================
-    plas.x_coords  = x_coords
-    plas.y_coords  = y_coords
-    plas.bx_coords = bx_coords
-    plas.by_coords = by_coords
+        if 'weights' in data:
+            plas.weights = data['weights'][()]
 
     return plas
 
 
+def loadDiagnostics(filename=None, gui=True):
+    """
+    Load the per-slice diagnostics written by :class:`blowout.diagnostics.Diagnostics`.
+
+    Returns a dict mapping every diagnostic name to a dict of its output arrays.
+    """
+    if filename is None and gui:
+        import scisalt.qt as _ssqt
+        filename = _ssqt.getOpenFileName()
+
+    with _h5.File(name=filename, mode='r') as f:
+        _checkversion(f)
+
+        diagnostics = dict()
+        for name, group in f['data'].items():
+            diagnostics[name] = {field: dset[()] for field, dset in group.items()}
+
+    return diagnostics
+
+
 def loadDrive(filename=None, gui=True):
     if filename is None and gui:
         import scisalt.qt as _ssqt
@@ -190,12 +237,44 @@ def loadDrive(filename=None, gui=True):
         charge = mattrs['charge']
         gamma  = mattrs['gamma']
 
+        centroid = dict(
+            x0          = mattrs.get('x0', 0),
+            y0          = mattrs.get('y0', 0),
+            tilt        = mattrs.get('tilt', 0),
+            xi_centroid = mattrs.get('xi_centroid', None),
+            round_tol   = mattrs.get('round_tol', 0)
+            )
+
+        if 'xi0' in mattrs:
+            return MultiDrive(
+                sx     = sx,
+                sy     = sy,
+                sz     = sz,
+                charge = charge,
+                gamma  = gamma,
+                xi0    = mattrs['xi0'],
+                rtol   = mattrs['rtol'],
+                **centroid
+                )
+
+        # ======================================
+        # Load tabulated profile
+        # ======================================
+        xi      = None
+        profile = None
+        if 'data' in f:
+            xi      = f['data']['xi'][()]
+            profile = f['data']['profile'][()]
+
     return Drive(
-        sx     = sx,
-        sy     = sy,
-        sz     = sz,
-        charge = charge,
-        gamma  = gamma
+        sx      = sx,
+        sy      = sy,
+        sz      = sz,
+        charge  = charge,
+        gamma   = gamma,
+        xi      = xi,
+        profile = profile,
+        **centroid
         )
     
 
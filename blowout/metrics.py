@@ -0,0 +1,135 @@
+"""
+Headless computation of per-slice bubble metrics for a directory of stored runs.
+
+Run as ``python -m blowout.metrics DIRECTORY`` or ``blowout-metrics DIRECTORY``. Each run is read in a worker process, touching only the candidate columns needed, and the metrics of all runs are streamed into one CSV file.
+"""
+import argparse as _argparse
+import csv as _csv
+import glob as _glob
+import logging as _logging
+import multiprocessing as _mp
+import numpy as _np
+import os as _os
+from .ions import _hough2phys
+from .load import loadPlasmaParams as _loadPlasmaParams
+from .candidates import Candidates as _Candidates
+from .support import _LazyModule
+
+_h5 = _LazyModule('h5py')
+
+_logger = _logging.getLogger(__name__)
+
+__all__ = [
+    'columns',
+    'find_runs',
+    'run_metrics',
+    'main'
+    ]
+
+columns = ('run', 'slice', 'xi', 'xc', 'yc', 'a', 'b', 'orientation', 'area', 'closure_xi')
+
+_names = ('xc', 'yc', 'a', 'b', 'orientation')
+
+
+def find_runs(directory):
+    """
+    Returns the file bases of all runs in ``directory`` with stored ion results.
+    """
+    suffix = '.ions.h5'
+    return sorted(filename[:-len(suffix)] for filename in _glob.glob(_os.path.join(directory, '*' + suffix)))
+
+
+def run_metrics(filebase, closure=0.1):
+    """
+    Computes the metrics of the run stored at ``filebase``.
+
+    Returns one row per slice with the fields in :data:`columns`: the best-fit cavity ellipse in physical units, its area, and the closure :math:`\\xi` of the run, the first slice after the largest cavity where the area drops below ``closure`` times the largest area or no ellipse is found.
+    """
+    params = _loadPlasmaParams(filename='{}.plasmaparams.h5'.format(filebase), gui=False)
+
+    with _h5.File('{}.ions.h5'.format(filebase), 'r') as f:
+        method   = f['metadata'].attrs.get('method', 'hough')
+        score    = f['metadata'].attrs.get('score', 'count_density')
+        data     = f['data']
+        gresults = data['results_flat']
+
+        # ======================================
+        # Read the candidate columns, then only
+        # the best row of every slice
+        # ======================================
+        candidates = _Candidates.read(gresults, names=tuple(dict.fromkeys((score, ) + _names)))
+        num_slices = len(candidates)
+        rows = candidates.best(score)
+        ellipses = _np.full((num_slices, len(_names)), _np.nan)
+        for i in _np.flatnonzero(rows >= 0):
+            ellipse = [candidates.column(name)[rows[i]] for name in _names]
+
+            if method == 'hough':
+                bins = f[data['img'][i]].shape
+                ellipse = _hough2phys(*ellipse, extent=data['extent'][i], bins=bins)
+
+            ellipses[i] = ellipse
+
+    xi = params.xi_bubble[:num_slices]
+    area = _np.pi * ellipses[:, 2] * ellipses[:, 3]
+    closure_xi = _closure_xi(xi, area, closure)
+
+    name = _os.path.basename(filebase)
+    return [(name, i, xi[i]) + tuple(ellipses[i]) + (area[i], closure_xi) for i in range(num_slices)]
+
+
+def _closure_xi(xi, area, closure):
+    if _np.all(_np.isnan(area)):
+        return _np.nan
+
+    # ======================================
+    # NaN area (no ellipse) counts as closed
+    # ======================================
+    peak = _np.nanargmax(area)
+    is_open = area[peak:] >= closure * area[peak]
+    closed = _np.flatnonzero(~is_open)
+    if closed.size == 0:
+        return _np.nan
+
+    return xi[peak + closed[0]]
+
+
+def _run_metrics(args):
+    filebase, closure = args
+    try:
+        return filebase, run_metrics(filebase, closure=closure)
+    except (KeyError, OSError) as err:
+        _logger.warning('Skipping {}: {}'.format(filebase, err))
+        return filebase, []
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+    """
+    parser = _argparse.ArgumentParser(description='Compute per-slice bubble metrics for a directory of stored runs.')
+    parser.add_argument('directory', help='Directory holding the run files.')
+    parser.add_argument('-o', '--output', default='metrics.csv', help='CSV file to write (default: metrics.csv).')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='Worker processes (default: number of CPUs).')
+    parser.add_argument('--closure', type=float, default=0.1, help='Fraction of the largest area at which the cavity counts as closed (default: 0.1).')
+    args = parser.parse_args(argv)
+
+    runs = find_runs(args.directory)
+    _logger.info('Found {} runs in {}'.format(len(runs), args.directory))
+
+    # ======================================
+    # Stream rows out as each run finishes
+    # ======================================
+    with open(args.output, 'w', newline='') as fcsv:
+        writer = _csv.writer(fcsv)
+        writer.writerow(columns)
+
+        with _mp.Pool(processes=args.processes) as pool:
+            for filebase, rows in pool.imap_unordered(_run_metrics, [(run, args.closure) for run in runs]):
+                writer.writerows(rows)
+                _logger.info('Done: {}'.format(filebase))
+
+
+if __name__ == '__main__':
+    _logging.basicConfig(level=_logging.INFO)
+    main()
@@ -0,0 +1,229 @@
+import mmap as _mmap
+import numpy as _np
+import zlib as _zlib
+from .support import _LazyModule
+
+_h5 = _LazyModule('h5py')
+
+__all__ = [
+    'ParticleState'
+    ]
+
+
+class ParticleState(object):
+    """
+    Particle coordinates :math:`(x, y, \\beta_x, \\beta_y)` for every slice, held in one contiguous buffer of shape ``(steps, 4, num_parts)``.
+
+    The state of slice ``i`` is the contiguous ``(4, num_parts)`` block ``state[i]``, so ``x, y, bx, by = state[i]`` unpacks it without copying. Slicing by step and particle range (``state[i0:i1]``, ``state[:, j0:j1]``) returns a new :class:`ParticleState` viewing the same memory.
+    """
+    fields = ('x', 'y', 'bx', 'by')
+
+    def __init__(self, steps=None, num_parts=None, buffer=None):
+        if buffer is None:
+            buffer = _np.empty(shape=(steps, len(self.fields), num_parts))
+        elif _np.ndim(buffer) != 3 or buffer.shape[1] != len(self.fields):
+            raise ValueError('Buffer must have shape (steps, {}, num_parts), got: {}'.format(len(self.fields), _np.shape(buffer)))
+
+        self._buffer = buffer
+
+    @property
+    def buffer(self):
+        """
+        The underlying ``(steps, 4, num_parts)`` array.
+        """
+        return self._buffer
+
+    @property
+    def steps(self):
+        """
+        Number of slices held.
+        """
+        return self._buffer.shape[0]
+
+    @property
+    def num_parts(self):
+        """
+        Number of particles held.
+        """
+        return self._buffer.shape[2]
+
+    @property
+    def x(self):
+        """
+        View of :math:`x` for all slices, shape ``(steps, num_parts)``.
+        """
+        return self._buffer[:, 0, :]
+
+    @property
+    def y(self):
+        """
+        View of :math:`y` for all slices, shape ``(steps, num_parts)``.
+        """
+        return self._buffer[:, 1, :]
+
+    @property
+    def bx(self):
+        """
+        View of :math:`\\beta_x` for all slices, shape ``(steps, num_parts)``.
+        """
+        return self._buffer[:, 2, :]
+
+    @property
+    def by(self):
+        """
+        View of :math:`\\beta_y` for all slices, shape ``(steps, num_parts)``.
+        """
+        return self._buffer[:, 3, :]
+
+    def __len__(self):
+        return self.steps
+
+    def __getitem__(self, key):
+        # ======================================
+        # A single step is the per-slice state
+        # ======================================
+        if _np.isscalar(key):
+            return self._buffer[key]
+
+        # ======================================
+        # Anything else stays a ParticleState
+        # ======================================
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 2:
+            raise IndexError('ParticleState takes at most a step and a particle index.')
+
+        step_key = _as_slice(key[0])
+        if len(key) == 2:
+            part_key = _as_slice(key[1])
+        else:
+            part_key = slice(None)
+
+        return ParticleState(buffer=self._buffer[step_key, :, part_key])
+
+    def write(self, group, name='coords', executor=None, **kwargs):
+        """
+        Write the state to ``group`` as one 3D dataset, chunked by slice.
+
+        With an ``executor`` (e.g. a :class:`concurrent.futures.ThreadPoolExecutor`), the slices of a dataset whose only filter is gzip are compressed in parallel on it and written as raw chunks; with any other filter, such as ``shuffle`` or ``fletcher32``, they are written normally. Additional keyword arguments are passed to :meth:`h5py.Group.create_dataset`.
+        """
+        kwargs.setdefault('compression', 'gzip')
+        kwargs.setdefault('chunks', (1, ) + self._buffer.shape[1:])
+        kwargs.setdefault('maxshape', (None, ) + self._buffer.shape[1:])
+        if executor is not None:
+            dset = group.create_dataset(name=name, shape=self._buffer.shape, dtype=self._buffer.dtype, **kwargs)
+            if self._direct_chunks(dset):
+                self._write_chunks(dset, 0, executor)
+            else:
+                dset[...] = self._buffer
+        else:
+            dset = group.create_dataset(name=name, data=self._buffer, **kwargs)
+        dset.attrs['fields'] = _np.array(self.fields, dtype='S')
+        return dset
+
+    def append(self, dataset, executor=None):
+        """
+        Grow a dataset written by :meth:`write` to hold every slice of this state, writing only the slices it does not already have.
+
+        With an ``executor``, the new slices are compressed in parallel as in :meth:`write`.
+        """
+        start = dataset.shape[0]
+        if start > self.steps:
+            raise ValueError('Dataset already holds {} slices, state only has {}'.format(start, self.steps))
+
+        dataset.resize(self.steps, axis=0)
+        if executor is not None and self._direct_chunks(dataset):
+            self._write_chunks(dataset, start, executor)
+        else:
+            dataset[start:] = self._buffer[start:]
+        return dataset
+
+    def _direct_chunks(self, dataset):
+        # ======================================
+        # Raw chunks need gzip as the only filter
+        # in the pipeline, one chunk per slice
+        # ======================================
+        if dataset.chunks is None or tuple(dataset.chunks) != (1, ) + self._buffer.shape[1:]:
+            return False
+        dcpl = dataset.id.get_create_plist()
+        filters = [dcpl.get_filter(j)[0] for j in range(dcpl.get_nfilters())]
+        return filters == [_h5.h5z.FILTER_DEFLATE]
+
+    def _write_chunks(self, dataset, start, executor):
+        level = dataset.compression_opts
+        dtype = dataset.dtype
+
+        def compress(i):
+            return _zlib.compress(_np.ascontiguousarray(self._buffer[i], dtype=dtype), level)
+
+        # ======================================
+        # zlib releases the GIL, HDF5 does not:
+        # compress on the pool, write here
+        # ======================================
+        for i, chunk in enumerate(executor.map(compress, range(start, self.steps)), start=start):
+            dataset.id.write_direct_chunk((i, 0, 0), chunk)
+
+    def resize(self, steps):
+        """
+        Returns a new :class:`ParticleState` with ``steps`` slices, holding the slices this state has in common with it.
+
+        A state from :meth:`memmap` that is writable stays backed by its file: the file is grown as needed (never shrunk) and mapped again with the new shape, so the common slices stay in place on disk. Any other state is copied into a new in-memory buffer.
+        """
+        buffer = self._buffer
+        if isinstance(buffer, _np.memmap) and isinstance(buffer.base, _mmap.mmap) and buffer.mode in ('r+', 'w+') and buffer.flags.c_contiguous:
+            # ======================================
+            # Slices lead, so the common ones keep
+            # their place in a longer file
+            # ======================================
+            shape = (steps, ) + buffer.shape[1:]
+            size = buffer.offset + int(_np.prod(shape)) * buffer.itemsize
+            buffer.flush()
+            with open(buffer.filename, 'r+b') as f:
+                if f.seek(0, 2) < size:
+                    f.truncate(size)
+            return ParticleState(buffer=_np.memmap(buffer.filename, dtype=buffer.dtype, mode='r+', offset=buffer.offset, shape=shape))
+
+        state = ParticleState(steps=steps, num_parts=self.num_parts)
+        common = min(steps, self.steps)
+        state.buffer[:common] = self._buffer[:common]
+        return state
+
+    @classmethod
+    def memmap(cls, filename, steps, num_parts, mode='w+'):
+        """
+        A :class:`ParticleState` backed by a memory-mapped file, for particle counts that do not fit in memory.
+        """
+        return cls(buffer=_np.memmap(filename, dtype=float, mode=mode, shape=(steps, len(cls.fields), num_parts)))
+
+    @classmethod
+    def iter_chunks(cls, dataset, steps=64, start=0, stop=None):
+        """
+        Streams a dataset written by :meth:`write` from disk, yielding ``(i0, state)`` for successive blocks of at most ``steps`` slices beginning at slice ``i0``.
+        """
+        if stop is None:
+            stop = dataset.shape[0]
+        for i0 in range(start, stop, steps):
+            yield i0, cls(buffer=dataset[i0:min(i0+steps, stop)])
+
+    @classmethod
+    def read(cls, dataset, out=None):
+        """
+        Read a dataset written by :meth:`write`, directly into the buffer of ``out`` if given.
+        """
+        if out is None:
+            out = cls(buffer=_np.empty(shape=dataset.shape, dtype=dataset.dtype))
+        elif out.buffer.shape != dataset.shape:
+            raise ValueError('Shape mismatch: dataset is {}, buffer is {}'.format(dataset.shape, out.buffer.shape))
+
+        dataset.read_direct(out.buffer)
+        return out
+
+
+def _as_slice(key):
+    # ======================================
+    # Integers keep their axis as length 1
+    # ======================================
+    if isinstance(key, slice):
+        return key
+    key = int(key)
+    return slice(key, key+1 if key != -1 else None)
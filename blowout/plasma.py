@@ -1,10 +1,10 @@
 from .support import _timestamp2filename
-import h5py as _h5
-import pkg_resources as _pkg_resources
+from .support import _LazyModule
+from . import __version__ as _version
 import scipy.constants as _spc
-import scisalt as _ss
 
-_version = _pkg_resources.get_distribution('blowout').version
+_h5 = _LazyModule('h5py')
+_ss = _LazyModule('scisalt')
 
 
 class PlasmaParams(object):
@@ -78,6 +78,26 @@ class PlasmaParams(object):
         """
         return self._dt
 
+    def extend(self, xi_end):
+        """
+        Moves the end of the simulation window to ``xi_end``, keeping the existing slices of :attr:`xi_bubble` unchanged.
+        """
+        if xi_end < self.xi_end:
+            raise ValueError('Can only extend the window: xi_end {} is before current xi_end {}'.format(xi_end, self.xi_end))
+
+        xi_bubble = _ss.numpy.linspacestep(self.xi_start, xi_end, self.dxi)
+        xi_bubble[:self._xi_bubble.size] = self._xi_bubble
+
+        self._xi_end    = xi_end
+        self._xi_bubble = xi_bubble
+
+    def _truncate(self, num_steps):
+        # ======================================
+        # Keep only the first num_steps slices
+        # ======================================
+        self._xi_bubble = self._xi_bubble[:num_steps]
+        self._xi_end    = self._xi_bubble[-1]
+
     def write(self, filename=None):
         """
         Write all of the plasma parameters to a file.
@@ -0,0 +1,62 @@
+"""
+Re-analysis of the ion cavity of stored runs with new analysis parameters, without re-simulating.
+
+The electron trajectories of a run are loaded and analyzed again with :meth:`blowout.ions.PlasmaIons.analyze`. Each analysis is stored in the run's ion file under ``analyses/<key>``, next to the analysis made during the simulation, where the key is :attr:`blowout.ions.PlasmaIons.analysis_key`: the analysis version and a hash of the parameters. An analysis whose key is already in the file is not repeated. Load one with ``blowout.load.loadPlasmaIons(..., analysis=key)``.
+"""
+import logging as _logging
+from .ions import PlasmaIons as _PlasmaIons
+from .load import loadPlasmaE as _loadPlasmaE
+from .load import loadPlasmaParams as _loadPlasmaParams
+from .support import _LazyModule
+
+_h5 = _LazyModule('h5py')
+
+_logger = _logging.getLogger(__name__)
+
+__all__ = [
+    'analyses',
+    'reanalyze'
+    ]
+
+
+def analyses(filebase):
+    """
+    Returns the keys of all analyses stored for the run at ``filebase``, the one made during the simulation first if it has a key.
+    """
+    with _h5.File('{}.ions.h5'.format(filebase), 'r') as f:
+        keys = list()
+        key = f['metadata'].attrs.get('analysis_key', None)
+        if key is not None:
+            keys.append(key)
+        if 'analyses' in f:
+            keys.extend(f['analyses'].keys())
+
+    return keys
+
+
+def reanalyze(filebase, processes=None, chunk=64, **kwargs):
+    """
+    Analyzes the run stored at ``filebase`` with the :class:`blowout.ions.PlasmaIons` parameters in ``kwargs`` and stores the result in its ion file.
+
+    ``processes`` and ``chunk`` are passed to :meth:`blowout.ions.PlasmaIons.analyze`. Returns the analysis key; nothing is computed if an analysis with that key is already stored.
+    """
+    params = _loadPlasmaParams(filename='{}.plasmaparams.h5'.format(filebase), gui=False)
+    ions = _PlasmaIons(PlasmaParams=params, **kwargs)
+    key = ions.analysis_key
+
+    if key in analyses(filebase):
+        _logger.info('Analysis {} of {} already stored, skipping'.format(key, filebase))
+        return key
+
+    # ======================================
+    # Analyze the stored trajectories
+    # ======================================
+    electrons = _loadPlasmaE(plasmaparams=params, filename='{}.electrons.h5'.format(filebase), gui=False)
+    ions.analyze(electrons.x_coords, electrons.y_coords, weights=electrons.weights, processes=processes, chunk=chunk)
+    ions._save_results()
+
+    with _h5.File('{}.ions.h5'.format(filebase), 'a') as f:
+        ions._write_group(f.require_group('analyses').create_group(key))
+
+    _logger.info('Stored analysis {} of {}'.format(key, filebase))
+    return key
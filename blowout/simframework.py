@@ -1,10 +1,12 @@
+import concurrent.futures as _futures
 from .formulas import dbetadt as _a
 import logging as _logging
 import numpy as _np
 import scipy.constants as _spc
-import scisalt as _ss
 import time as _time
+from .support import _LazyModule
 _logger = _logging.getLogger(__name__)
+_ss     = _LazyModule('scisalt')
 
 
 __all__ = [
@@ -15,12 +17,141 @@ __all__ = [
 class SimFrame(object):
     """
     Coordinates and steps through the simulation.
+
+    With ``stop_area``, the simulation stops once the fitted ion cavity has opened and its area falls back below ``stop_area``, and the stored slices are truncated there. With ``r_max``, particles that move further than ``r_max`` from the axis are dropped: they are excluded from the fields and histograms, and their coordinates are NaN from then on. Their earlier slices stay valid, so storage keeps the full particle axis: the NaN tails compress to almost nothing on disk, but the in-memory coordinates still scale with the original ``num_parts``.
+
+    With ``impulse_tol``, particles are advanced ballistically, without evaluating the drive fields, while the change in :math:`\\beta` they skip stays below ``impulse_tol`` over the whole call to :meth:`sim`; the rest are pushed. Every ``reevaluate`` slices, the change over the next ``reevaluate`` slices is estimated from the acceleration at the particles' current positions under the densest drive slice in that window, scaled by the line charge of the whole window; against the full push this is within about ten percent. Particles within three bunch sizes of a bunch centroid are always pushed, as the fields change sign across the bunch and an error made coasting there grows once it passes. The estimate is not a bound: a ballistic particle that drifts into stronger fields keeps coasting until the next estimate, so fewer slices between estimates trade time for accuracy.
+
+    With ``diagnostics``, a :class:`blowout.diagnostics.Diagnostics`, the live particles of every slice are reduced as the slice is reached.
     """
-    def __init__(self, Drive, PlasmaE, PlasmaIons):
-        self._Drive      = Drive
-        self._PlasmaE    = PlasmaE
-        self._PlasmaIons = PlasmaIons
-        self._timestamp  = None
+    def __init__(self, Drive, PlasmaE, PlasmaIons, stop_area=None, r_max=None, impulse_tol=None, reevaluate=8, diagnostics=None):
+        self._Drive       = Drive
+        self._PlasmaE     = PlasmaE
+        self._PlasmaIons  = PlasmaIons
+        self._stop_area   = stop_area
+        self._r_max       = r_max
+        self._impulse_tol = impulse_tol
+        self._reevaluate  = reevaluate
+        self._diagnostics = diagnostics
+        self._timestamp   = None
+        self._step_start  = 0
+        self._closure     = 0
+
+    @property
+    def stop_area(self):
+        """
+        Cavity area below which the simulation stops once the cavity has opened, or ``None``.
+        """
+        return self._stop_area
+
+    @property
+    def r_max(self):
+        """
+        Radius beyond which particles are dropped, or ``None``.
+        """
+        return self._r_max
+
+    @property
+    def impulse_tol(self):
+        """
+        Estimated change in :math:`\\beta` that ballistic particles may skip in total, or ``None``.
+        """
+        return self._impulse_tol
+
+    @property
+    def reevaluate(self):
+        """
+        Number of slices between re-evaluations of the active set.
+        """
+        return self._reevaluate
+
+    @property
+    def diagnostics(self):
+        """
+        The :class:`blowout.diagnostics.Diagnostics` computed during the push, or ``None``.
+        """
+        return self._diagnostics
+
+    def extend(self, xi_end):
+        """
+        Extends the simulation window to ``xi_end``.
+
+        The next call to :meth:`sim` continues pushing from the last slice already simulated, and ``write(append=True)`` adds only the new slices to the existing files.
+        """
+        PlasmaParams = self.PlasmaE.PlasmaParams
+        self._step_start = PlasmaParams.num_steps - 1
+
+        PlasmaParams.extend(xi_end)
+        self.PlasmaE._resize()
+        self.PlasmaIons._resize()
+
+    def _closed(self, i):
+        if self.stop_area is None:
+            return False
+
+        # ======================================
+        # Wait for the area to dip below (no
+        # cavity yet), rise above (cavity open),
+        # then dip below again (cavity closed)
+        # ======================================
+        is_open = self.PlasmaIons.area(i) >= self.stop_area
+        if self._closure == 0 and not is_open:
+            self._closure = 1
+        elif self._closure == 1 and is_open:
+            self._closure = 2
+        elif self._closure == 2 and not is_open:
+            return True
+
+        return False
+
+    def _active(self, i, ind, dt, skipped):
+        """
+        Mask of the particles to push over the slices from ``i`` to the next re-evaluation: those whose estimated change in :math:`\\beta` over these slices, added to the estimates already skipped in ``skipped``, reaches :attr:`impulse_tol`. The estimates of the others are added to ``skipped``.
+        """
+        PlasmaE = self.PlasmaE
+        xi_bubble = PlasmaE.PlasmaParams.xi_bubble
+        stop = min(i + self.reevaluate, len(xi_bubble) - 1)
+
+        # ======================================
+        # Fields are linear in the charge: take
+        # them at the densest slice ahead and
+        # scale by the charge of all of them
+        # ======================================
+        q = _np.abs(self.Drive.q[i:stop]).reshape(stop-i, -1).sum(axis=1)
+        k = _np.argmax(q)
+
+        x  = PlasmaE.x_coords[i, ind]
+        y  = PlasmaE.y_coords[i, ind]
+        bx = PlasmaE.bx_coords[i, ind]
+        by = PlasmaE.by_coords[i, ind]
+
+        if q[k] > 0:
+            E_x, E_y = self.Drive.E_fields(x, y, xi_bubble[i+k], step=i+k)
+            acc = _a(x, y, bx, by, E_x, E_y)
+            impulse = _np.hypot(acc[0], acc[1]) * dt * (_np.sum(q) / q[k])
+
+            # ======================================
+            # The fields change sign across a bunch,
+            # so an error made coasting inside one
+            # grows: always push its particles
+            # ======================================
+            x0, y0, _ = [_np.atleast_1d(value) for value in self.Drive.centroid(xi_bubble[i+k])]
+            size = 3 * _np.maximum(self.Drive.sx, self.Drive.sy)
+            inside = _np.any(_np.hypot(_np.subtract.outer(x, x0), _np.subtract.outer(y, y0)) < size, axis=-1)
+            impulse[inside] = _np.inf
+        else:
+            impulse = _np.zeros(_np.shape(x))
+
+        # ======================================
+        # Coast only while the skipped impulse
+        # stays within the tolerance
+        # ======================================
+        impulse += skipped[ind]
+        active = _np.zeros(PlasmaE.num_parts, dtype=bool)
+        active[ind] = impulse >= self.impulse_tol
+        skipped[ind] = _np.where(active[ind], skipped[ind], impulse)
+        _logger.debug('Active particles at slice {}: {}'.format(i, _np.sum(active)))
+        return active
 
     def sim(self):
         # ======================================
@@ -31,41 +162,112 @@ class SimFrame(object):
         _logger.info('Time step dt: {}'.format(dt))
 
         PlasmaE = self.PlasmaE
+        xi_bubble = PlasmaE.PlasmaParams.xi_bubble
+        self.Drive.set_grid(xi_bubble)
+        if self.diagnostics is not None:
+            self.diagnostics._resize(len(xi_bubble))
+
+        # ======================================
+        # Particles already dropped stay dropped
+        # ======================================
+        alive = _np.isfinite(PlasmaE.x_coords[self._step_start])
+        ind = slice(None) if _np.all(alive) else _np.flatnonzero(alive)
+        sub = slice(None)
+        stop = None
+        if self.impulse_tol is not None:
+            skipped = _np.zeros(PlasmaE.num_parts)
         
         # ======================================
         # Push particles
         # ======================================
-        with _ss.utils.progressbar(total=len(PlasmaE.PlasmaParams.xi_bubble), length=100) as myprog:
-            for i, xi in enumerate(PlasmaE.PlasmaParams.xi_bubble[0:-1]):
+        with _ss.utils.progressbar(total=len(xi_bubble), length=100) as myprog:
+            for i in range(self._step_start, len(xi_bubble)):
                 myprog.step = i+1
+
+                # ======================================
+                # Get ion shape
+                # ======================================
+                if i >= self.PlasmaIons.num_analyzed:
+                    self.PlasmaIons.add_ion_ellipse(PlasmaE.x_coords[i, ind], PlasmaE.y_coords[i, ind], weights=PlasmaE.weights[ind])
+                    if self._closed(i):
+                        stop = i
+
+                # ======================================
+                # Reduce the live particles
+                # ======================================
+                if self.diagnostics is not None:
+                    self.diagnostics.update(i, PlasmaE.x_coords[i, ind], PlasmaE.y_coords[i, ind], PlasmaE.bx_coords[i, ind], PlasmaE.by_coords[i, ind], PlasmaE.weights[ind])
+
+                if stop is not None:
+                    break
+
+                if i == len(xi_bubble) - 1:
+                    break
+                xi = xi_bubble[i]
+
+                # ======================================
+                # Refresh the active set
+                # ======================================
+                if self.impulse_tol is not None and (i - self._step_start) % self.reevaluate == 0:
+                    active = self._active(i, ind, dt, skipped)
+                if self.impulse_tol is not None:
+                    sub = active[ind]
+
+                x  = PlasmaE.x_coords[i, ind]
+                y  = PlasmaE.y_coords[i, ind]
+                bx = PlasmaE.bx_coords[i, ind]
+                by = PlasmaE.by_coords[i, ind]
+
                 # ======================================
                 # Update positions
                 # ======================================
-                PlasmaE.x_coords[i+1, :] = PlasmaE.x_coords[i, :] + PlasmaE.bx_coords[i, :] * _spc.speed_of_light * dt
-                PlasmaE.y_coords[i+1, :] = PlasmaE.y_coords[i, :] + PlasmaE.by_coords[i, :] * _spc.speed_of_light * dt
+                PlasmaE.x_coords[i+1, ind] = x + bx * _spc.speed_of_light * dt
+                PlasmaE.y_coords[i+1, ind] = y + by * _spc.speed_of_light * dt
 
                 # ======================================
-                # Get ion shape
+                # Get drive fields at active particles
+                # ======================================
+                E_x, E_y = self.Drive.E_fields(x[sub], y[sub], xi, step=i)
+
                 # ======================================
-                self.PlasmaIons.add_ion_ellipse(PlasmaE.x_coords[i], PlasmaE.y_coords[i])
-                for j, (x, y, bx, by) in enumerate(zip(PlasmaE.x_coords[i, :], PlasmaE.y_coords[i, :], PlasmaE.bx_coords[i, :], PlasmaE.by_coords[i, :])):
-                    # ======================================
-                    # Get drive fields at particles
-                    # ======================================
-                    E = self.Drive.E_fields(x, y, xi) * self.Drive.gamma
+                # Get ion fields at particles
+                # ======================================
+                acc = _a(x[sub], y[sub], bx[sub], by[sub], E_x, E_y)
 
-                    # ======================================
-                    # Get ion fields at particles
-                    # ======================================
-                    acc = _a(x, y, bx, by, E[0], E[1])
+                # ======================================
+                # Update velocities, ballistic
+                # particles keep theirs
+                # ======================================
+                bx = _np.array(bx)
+                by = _np.array(by)
+                bx[sub] += acc[0] * dt
+                by[sub] += acc[1] * dt
+                PlasmaE.bx_coords[i+1, ind] = bx
+                PlasmaE.by_coords[i+1, ind] = by
 
-                    # ======================================
-                    # Update velocities
-                    # ======================================
-                    PlasmaE.bx_coords[i+1, j] = PlasmaE.bx_coords[i, j] + acc[0] * dt
-                    PlasmaE.by_coords[i+1, j] = PlasmaE.by_coords[i, j] + acc[1] * dt
+                # ======================================
+                # Drop particles beyond r_max
+                # ======================================
+                if self.r_max is not None:
+                    out = _np.hypot(PlasmaE.x_coords[i+1, ind], PlasmaE.y_coords[i+1, ind]) > self.r_max
+                    if _np.any(out):
+                        alive[_np.arange(PlasmaE.num_parts)[ind][out]] = False
+                        ind = _np.flatnonzero(alive)
+                if not isinstance(ind, slice):
+                    PlasmaE.coords.buffer[i+1][:, ~alive] = _np.nan
+
+        # ======================================
+        # Compact storage after an early stop
+        # ======================================
+        if stop is not None:
+            _logger.info('Cavity closed at xi = {}, stopping after {} slices'.format(xi_bubble[stop], stop+1))
+            PlasmaE.PlasmaParams._truncate(stop+1)
+            PlasmaE._resize()
+            self.PlasmaIons._resize()
+            if self.diagnostics is not None:
+                self.diagnostics._resize(stop+1)
 
-        self.PlasmaIons.add_ion_ellipse(PlasmaE.x_coords[-1], PlasmaE.y_coords[-1])
+        self._step_start = PlasmaE.PlasmaParams.num_steps - 1
 
         # ======================================
         # Record completion timestamp
@@ -75,6 +277,8 @@ class SimFrame(object):
         self.PlasmaE._set_timestamp(self._timestamp)
         self.PlasmaIons._set_timestamp(self._timestamp)
         self.Drive._set_timestamp(self._timestamp)
+        if self.diagnostics is not None:
+            self.diagnostics._set_timestamp(self._timestamp)
 
     @property
     def PlasmaE(self):
@@ -97,8 +301,45 @@ class SimFrame(object):
         """
         return self._Drive
 
-    def write(self, filename=None):
-        self.PlasmaE.PlasmaParams.write(filename=filename)
-        self.PlasmaIons.write(filename=filename)
-        self.PlasmaE.write(filename=filename)
-        self.Drive.write(filename=filename)
+    def write(self, filename=None, append=False, workers=1, background=False, trajectories=True):
+        """
+        Writes the simulation. With ``append``, the ion and electron files of an extended run are grown in place rather than rewritten.
+
+        With ``workers`` greater than one, the plasma parameters, ions and drive are written concurrently on a thread pool of that size while the electron coordinates are compressed slice-parallel on the same pool. With ``background``, returns a :class:`concurrent.futures.Future` at once instead of waiting; call its ``result()`` to join, and leave the simulation untouched until then.
+
+        The :attr:`diagnostics`, if any, are written whole. Without ``trajectories``, the electron file is not written.
+        """
+        if background:
+            driver = _futures.ThreadPoolExecutor(max_workers=1)
+            future = driver.submit(self._write, filename, append, workers, trajectories)
+            driver.shutdown(wait=False)
+            return future
+
+        self._write(filename, append, workers, trajectories)
+
+    def _write(self, filename, append, workers, trajectories):
+        if self.diagnostics is not None:
+            self.diagnostics.write(filename=filename)
+
+        if workers <= 1:
+            self.PlasmaE.PlasmaParams.write(filename=filename)
+            self.PlasmaIons.write(filename=filename, append=append)
+            if trajectories:
+                self.PlasmaE.write(filename=filename, append=append)
+            self.Drive.write(filename=filename)
+            return
+
+        # ======================================
+        # Small files on the pool, electrons
+        # here with chunks compressed on the pool
+        # ======================================
+        with _futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            jobs = [
+                pool.submit(self.PlasmaE.PlasmaParams.write, filename=filename),
+                pool.submit(self.PlasmaIons.write, filename=filename, append=append),
+                pool.submit(self.Drive.write, filename=filename)
+                ]
+            if trajectories:
+                self.PlasmaE.write(filename=filename, append=append, executor=pool)
+            for job in jobs:
+                job.result()
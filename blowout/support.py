@@ -1,12 +1,28 @@
-import h5py as _h5
+import importlib as _importlib
 import numpy as _np
 import logging as _logging
 import time as _time
 _logger  = _logging.getLogger(__name__)
-import ipdb as pdb
 import re as _re
 
 
+class _LazyModule(object):
+    """
+    Stands in for the module ``name``, importing it on first attribute access.
+    """
+    def __init__(self, name):
+        self._name   = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = _importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+_h5 = _LazyModule('h5py')
+
+
 def _timestamp2filename(cls, ftype, filename=None):
     # ======================================
     # Get filename from timestamp
@@ -43,11 +59,36 @@ class Timestamp(object):
 def _write_arrays(group, name, data, parent=None):
     grefs = group.create_group('_refs_{}'.format(name))
     ref_dtype = _h5.special_dtype(ref=_h5.Reference)
-    dname = group.create_dataset(name, (_np.size(data),), dtype=ref_dtype)
+    dname = group.create_dataset(name, (_np.size(data),), dtype=ref_dtype, maxshape=(None,), chunks=True)
+    _fill_refs(dname, grefs, data, name)
+
+    # if parent == 'hist':
+    #     pdb.set_trace()
+
+    # ======================================
+    # Return created dataset
+    # ======================================
+    return dname
+
+
+def _append_arrays(group, name, data):
+    """
+    Appends ``data`` to references created by :func:`_write_arrays`.
+    """
+    grefs = group['_refs_{}'.format(name)]
+    dname = group[name]
+    start = dname.shape[0]
+    dname.resize((start + _np.size(data),))
+    _fill_refs(dname, grefs, data, name, start=start)
+
+    return dname
+
+
+def _fill_refs(dname, grefs, data, name, start=0):
     # ======================================
     # Create datasets
     # ======================================
-    for i, array in enumerate(data):
+    for i, array in enumerate(data, start):
         if array.dtype == _np.dtype(object):
             # ======================================
             # If dataset can't be created, nest
@@ -61,26 +102,31 @@ def _write_arrays(group, name, data, parent=None):
         # ======================================
         dname[i] = darray.ref
 
-    # if parent == 'hist':
-    #     pdb.set_trace()
-
-    # ======================================
-    # Return created dataset
-    # ======================================
-    return dname
-
 
 def _read_arrays(group, name):
     refs = group[name]
     arrays = _np.empty(shape=refs.size, dtype=object)
     for i, ref in enumerate(refs):
-        arrays[i] = group.file[ref].value
+        arrays[i] = group.file[ref][()]
 
     return arrays
 
 
 def _write_scalars(group, name, data):
-    return group.create_dataset(name=name, data=data, shape=_np.shape(data), compression="gzip")
+    shape = _np.shape(data)
+    return group.create_dataset(name=name, data=data, shape=shape, maxshape=(None,) + shape[1:], compression="gzip")
+
+
+def _append_scalars(group, name, data):
+    """
+    Appends ``data`` along the first axis of a dataset created by :func:`_write_scalars`.
+    """
+    dname = group[name]
+    start = dname.shape[0]
+    dname.resize(start + _np.shape(data)[0], axis=0)
+    dname[start:] = data
+
+    return dname
 
 
 def _write_data(group, name, data):
@@ -102,10 +148,10 @@ def _read_dict(group, name):
         if not underscore.match(nm):
             valid_names.append(nm)
             dict_layout['names'].append(nm)
-            if type(ret_group[nm].value[0]) == _h5.h5r.Reference:
+            if type(ret_group[nm][0]) == _h5.h5r.Reference:
                 dict_layout['formats'].append(object)
             else:
-                raise NotImplementedError('Haven''t done this...')
+                dict_layout['formats'].append(ret_group[nm].dtype)
 
     results_flat = _np.zeros(len(ret_group[valid_names[0]]), dtype=dict_layout)
 
@@ -113,16 +159,20 @@ def _read_dict(group, name):
         # if nm == 'hist':
         #     pdb.set_trace()
         values = ret_group[nm]
+        if dict_layout['formats'][dict_layout['names'].index(nm)] != object:
+            results_flat[nm] = values[()]
+            continue
+
         for i, value in enumerate(values):
             try:
-                array = group.file[value].value
+                array = group.file[value][()]
                 if array.size > 0:
                     if type(array[0]) == _h5.h5r.Reference:
                         out = _np.empty(len(array), dtype=object)
                         for j, val in enumerate(array):
-                            out[j] = group.file[val].value
+                            out[j] = group.file[val][()]
                     else:
-                        out = group.file[value].value
+                        out = group.file[value][()]
                 else:
                     out = _np.array([])
                 results_flat[nm][i] = out
@@ -0,0 +1,158 @@
+"""
+Per-particle reductions over stored electron trajectories, streamed from disk a block of slices at a time.
+
+Each :class:`Reduction` maps a block of slices to a partial result per particle and combines partial results of separate blocks, so a run of any size is reduced in memory bounded by the block size. :func:`map_reduce` maps the blocks in a pool of worker processes, each reading its own blocks from the file.
+
+Consecutive blocks share one slice: the block beginning at slice ``i0`` also holds slice ``i0 - 1`` (except the first one), so reductions over steps between slices see every step exactly once. Particles dropped by ``r_max`` are NaN and contribute nothing from then on.
+"""
+import multiprocessing as _mp
+import numpy as _np
+from .particles import ParticleState as _ParticleState
+from .support import _LazyModule
+
+_h5 = _LazyModule('h5py')
+
+__all__ = [
+    'AxisCrossings',
+    'FinalVelocity',
+    'MaxExcursion',
+    'PathLength',
+    'Reduction',
+    'map_reduce'
+    ]
+
+
+class Reduction(object):
+    """
+    Base class for per-particle reductions.
+
+    Subclasses set :attr:`name` and implement :meth:`map` and :meth:`combine`; :meth:`finalize` turns the combined partial result into the returned one.
+    """
+    name = None
+
+    def map(self, i0, state):
+        """
+        Partial result of the block ``state``, a :class:`blowout.particles.ParticleState` whose first slice is slice ``i0``.
+        """
+        raise NotImplementedError
+
+    def combine(self, a, b):
+        """
+        Combines the partial results ``a`` and ``b`` of two blocks, ``a`` the earlier one.
+        """
+        raise NotImplementedError
+
+    def finalize(self, partial):
+        """
+        The result from the partial result of all blocks.
+        """
+        return partial
+
+
+class PathLength(Reduction):
+    """
+    Transverse distance travelled by every particle, :math:`\\sum_i \\sqrt{\\Delta x_i^2 + \\Delta y_i^2}`.
+    """
+    name = 'path_length'
+
+    def map(self, i0, state):
+        steps = _np.hypot(_np.diff(state.x, axis=0), _np.diff(state.y, axis=0))
+        return _np.sum(_np.where(_np.isnan(steps), 0, steps), axis=0)
+
+    def combine(self, a, b):
+        return a + b
+
+
+class MaxExcursion(Reduction):
+    """
+    Largest distance :math:`r = \\sqrt{x^2 + y^2}` of every particle from the axis.
+    """
+    name = 'max_excursion'
+
+    def map(self, i0, state):
+        return _np.fmax.reduce(_np.hypot(state.x, state.y), axis=0)
+
+    def combine(self, a, b):
+        return _np.fmax(a, b)
+
+
+class AxisCrossings(Reduction):
+    """
+    Number of times every particle crosses the planes :math:`x = 0` and :math:`y = 0`, shape ``(2, num_parts)``.
+    """
+    name = 'axis_crossings'
+
+    def map(self, i0, state):
+        return _np.stack([_np.sum(u[:-1] * u[1:] < 0, axis=0) for u in (state.x, state.y)])
+
+    def combine(self, a, b):
+        return a + b
+
+
+class FinalVelocity(Reduction):
+    """
+    :math:`(\\beta_x, \\beta_y)` of every particle at its last slice, shape ``(2, num_parts)``; NaN for particles dropped before it.
+    """
+    name = 'final_velocity'
+
+    def map(self, i0, state):
+        return i0 + state.steps, _np.stack((state.bx[-1], state.by[-1]))
+
+    def combine(self, a, b):
+        return a if a[0] > b[0] else b
+
+    def finalize(self, partial):
+        return partial[1]
+
+
+def map_reduce(filebase, reductions, chunk=64, processes=None):
+    """
+    Applies ``reductions`` to the trajectories of the run stored at ``filebase``, holding at most ``chunk + 1`` slices in memory per process.
+
+    Blocks are mapped on a pool of ``processes`` worker processes, by default one per CPU, or in this process if ``processes`` is 1. Returns a dict of results keyed by :attr:`Reduction.name`. Raises :class:`ValueError` if the run holds no slices.
+    """
+    names = [reduction.name for reduction in reductions]
+    if len(set(names)) != len(names):
+        raise ValueError('Reduction names must be unique, got: {}'.format(names))
+
+    filename = '{}.electrons.h5'.format(filebase)
+    with _h5.File(filename, 'r') as f:
+        steps = f['data']['coords'].shape[0]
+    if steps == 0:
+        raise ValueError('{} holds no slices to reduce.'.format(filename))
+    jobs = [(filename, reductions, i0, min(i0+chunk, steps)) for i0 in range(0, steps, chunk)]
+
+    # ======================================
+    # Fold partials in block order as they
+    # arrive
+    # ======================================
+    if processes == 1:
+        partials = _fold(map(_map_block, jobs), reductions)
+    else:
+        with _mp.Pool(processes=processes) as pool:
+            partials = _fold(pool.imap(_map_block, jobs), reductions)
+
+    return {reduction.name: reduction.finalize(partial) for reduction, partial in zip(reductions, partials)}
+
+
+def _fold(blocks, reductions):
+    partials = None
+    for block in blocks:
+        if partials is None:
+            partials = block
+        else:
+            partials = [reduction.combine(a, b) for reduction, a, b in zip(reductions, partials, block)]
+    return partials
+
+
+def _map_block(args):
+    filename, reductions, i0, i1 = args
+
+    # ======================================
+    # Overlap the previous block by a slice
+    # ======================================
+    start = max(i0 - 1, 0)
+    with _h5.File(filename, 'r') as f:
+        state = _ParticleState(buffer=f['data']['coords'][start:i1])
+
+    return [reduction.map(start, state) for reduction in reductions]
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+import blowout as bo
+
+# ======================================
+# Load a reference run analyzed with the
+# Hough transform
+# ======================================
+filename = '2015.08.27.1654.16'
+sim      = bo.load.loadSim(filename)
+PlasmaE  = sim.PlasmaE
+
+# ======================================
+# Re-estimate every slice from particles
+# ======================================
+sectors = bo.ions.PlasmaIons(PlasmaParams=PlasmaE.PlasmaParams, method='sectors')
+for x, y in zip(PlasmaE.x_coords, PlasmaE.y_coords):
+    sectors.add_ion_ellipse(x, y)
+sectors._save_results()
+
+# ======================================
+# Compare semi-axes slice by slice
+# ======================================
+print('{:>5} {:>12} {:>12} {:>12} {:>12}'.format('slice', 'a (hough)', 'a (sectors)', 'b (hough)', 'b (sectors)'))
+for i in range(PlasmaE.PlasmaParams.num_steps):
+    a_h, b_h = sim.PlasmaIons.ellipse(i)[2:4]
+    a_s, b_s = sectors.ellipse(i)[2:4]
+    print('{:>5} {:>12.4e} {:>12.4e} {:>12.4e} {:>12.4e}'.format(i, a_h, a_s, b_h, b_s))
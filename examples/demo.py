@@ -63,7 +63,7 @@ E_mag = np.sqrt(E_x**2 + E_y**2)
 # ======================================
 # Evaluate 2D Circular Gaussian
 # ======================================
-new = np.abs(invlaw(Xgrid.T, Ygrid.T, 1))
+new = np.hypot(*invlaw(Xgrid.T, Ygrid.T, 1, 1))
 
 # ======================================
 # Plot Basetti-Erskine
@@ -87,7 +87,7 @@ sm.addlabel(ax=ax[0, 2], toplabel='Field Magnitude Difference', xlabel='x', ylab
 # Plot differences in major, minor axes
 # ======================================
 x = np.linspace(0, sx*5, 1000)
-line1 = ax[1, 0].plot(x, invlaw(x, 0, 1), label='$E_x$, Circularly Symmetric')
+line1 = ax[1, 0].plot(x, invlaw(x, 0, 1, 1)[0], label='$E_x$, Circularly Symmetric')
 # ylim = ax.get_ylim()
 E_xaxis, temp = E_complex(x, 0, sx, sy, 1)
 temp, E_yaxis = E_complex(0, x, sx, sy, 1)